@@ -6,11 +6,24 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('templates', 'templates'), ('static', 'static')],
-    hiddenimports=[],
+    # pdf_render importa o WeasyPrint sob demanda; declarado aqui para entrar no executável
+    hiddenimports=[
+        'sqlalchemy.sql.default_comparator',
+        'flask_login',
+        'flask_sqlalchemy',
+        'weasyprint',
+        'weasyprint.text.fonts',
+        'cairo',
+        'cffi',
+        'markupsafe',
+        'jinja2',
+        'werkzeug.security',
+    ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Módulos da biblioteca padrão que a aplicação não usa (executável menor, arranque mais rápido)
+    excludes=['tkinter', '_tkinter', 'test', 'idlelib', 'lib2to3', 'pydoc_data', 'ensurepip'],
     noarchive=False,
     optimize=0,
 )
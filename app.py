@@ -5,10 +5,26 @@ Versão final refatorada, consolidando todas as funcionalidades e correções.
 import os
 import sys
 import base64
+import csv
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import mimetypes
+import queue
+import random
+import re
+import secrets
+import sqlite3
+import subprocess
+import time
 from datetime import datetime, date, timezone, timedelta
-from functools import wraps
-from typing import Optional
+from functools import lru_cache, wraps
+from typing import Callable, Optional
+from urllib.parse import urlencode
 
+import click
 from flask import (
     Flask,
     abort,
@@ -18,10 +34,20 @@ from flask import (
     request,
     url_for,
     flash,
+    g,
+    has_app_context,
+    has_request_context,
+    before_render_template,
+    template_rendered,
+    jsonify,
+    send_file,
+    Response,
+    stream_with_context,
 )
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import or_
-from weasyprint import HTML
+from sqlalchemy import DDL, create_engine, event, or_
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
 from flask_login import (
     LoginManager,
     UserMixin,
@@ -32,6 +58,16 @@ from flask_login import (
 )
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from assets import EXTENSOES_COMPRIMIDAS, EXTENSOES_TEXTO, ManifestoAssets, codificacoes_disponiveis, comprimir, precomprimir
+from cache_fragmentos import CacheFragmentos
+from cache_memoria import CacheLRU
+from eventos import CanalEventos
+import pdf_render
+from log_sink import FilaLogs
+from metricas import MetricasRequests
+from pdf_cache import CachePdf, gerar_chave
+from pdf_jobs import FilaCheiaError, FilaPdf
+
 # -------------------------
 # Configuração da aplicação
 # -------------------------
@@ -44,11 +80,134 @@ else:
     base_dir = os.path.dirname(os.path.abspath(__file__))
 
 db_path = os.path.join(base_dir, 'testes.db')
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # leitores não bloqueiam o escritor (e vice-versa)
+    "PRAGMA synchronous=NORMAL",  # seguro com WAL e evita um fsync por commit
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",  # espera pelo lock em vez de "database is locked"
+    "PRAGMA cache_size=-20000",  # ~20 MB de cache de páginas por conexão
+    "PRAGMA temp_store=MEMORY",
+)
+
+def get_database_uri() -> str:
+    """URI do banco: DATABASE_URL (ex.: PostgreSQL) ou o testes.db local."""
+    uri = os.environ.get("DATABASE_URL", f"sqlite:///{db_path}")
+    # Render/Heroku ainda fornecem o esquema antigo "postgres://"
+    if uri.startswith("postgres://"):
+        uri = "postgresql://" + uri[len("postgres://"):]
+    return uri
+
+def get_engine_options(uri: str) -> dict:
+    """Opções do pool de conexões, configuráveis por variáveis de ambiente."""
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # SQLite em memória usa StaticPool (uma única conexão), que não aceita opções de pool
+        return {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    opcoes = {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+    }
+    if uri.startswith("sqlite"):
+        opcoes["connect_args"] = {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    else:
+        opcoes["pool_pre_ping"] = True
+        opcoes["pool_recycle"] = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    return opcoes
+
+@event.listens_for(Engine, "connect")
+def _configurar_sqlite(dbapi_connection, connection_record):
+    """Aplica os PRAGMAs de concorrência/desempenho em cada nova conexão SQLite."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+app.config["SQLALCHEMY_DATABASE_URI"] = get_database_uri()
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = get_engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SECRET_KEY"] = "uma-chave-secreta-muito-segura-para-producao"
+app.config["ITENS_POR_PAGINA"] = int(os.environ.get("ITENS_POR_PAGINA", 50))
+# Exportação de PDF: relatórios até PDF_LIMITE_INLINE linhas são gerados no próprio
+# request; acima disso vão para a fila em segundo plano (pdf_jobs.FilaPdf).
+app.config["PDF_LIMITE_INLINE"] = int(os.environ.get("PDF_LIMITE_INLINE", 200))
+app.config["PDF_SPOOL_DIR"] = os.environ.get("PDF_SPOOL_DIR", os.path.join(base_dir, "spool_pdf"))
+app.config["PDF_WORKERS"] = int(os.environ.get("PDF_WORKERS", 2))
+app.config["PDF_MAX_PENDENTES"] = int(os.environ.get("PDF_MAX_PENDENTES", 8))
+app.config["PDF_SPOOL_TTL"] = int(os.environ.get("PDF_SPOOL_TTL", 3600))
+app.config["PDF_CACHE_DIR"] = os.environ.get("PDF_CACHE_DIR", os.path.join(base_dir, "cache_pdf"))
+app.config["PDF_CACHE_MAX_MB"] = int(os.environ.get("PDF_CACHE_MAX_MB", 200))
+# O WeasyPrint (pdf_render) só é importado sob demanda; com PDF_AQUECER=1 é preparado numa
+# thread logo após o boot (main.py / gunicorn.conf.py), para a primeira exportação não esperar.
+app.config["PDF_AQUECER"] = os.environ.get("PDF_AQUECER", "1") == "1"
+# Logs de auditoria: "transacao" grava o Log no mesmo commit da alteração; "fila" envia-o
+# para uma thread que grava em lote (log_sink.FilaLogs) a cada LOG_FILA_INTERVALO segundos.
+app.config["LOG_MODO"] = os.environ.get("LOG_MODO", "transacao")
+app.config["LOG_FILA_MAX"] = int(os.environ.get("LOG_FILA_MAX", 10000))
+app.config["LOG_FILA_INTERVALO"] = float(os.environ.get("LOG_FILA_INTERVALO", 2.0))
+# Cache de utilizadores do load_user: TTL/LRU por processo, invalidado entre workers pelo
+# contador "usuarios" de versao_dados, consultado no máximo a cada USER_CACHE_VERIFICACAO s.
+app.config["USER_CACHE_TTL"] = int(os.environ.get("USER_CACHE_TTL", 300))
+app.config["USER_CACHE_MAX"] = int(os.environ.get("USER_CACHE_MAX", 1024))
+app.config["USER_CACHE_VERIFICACAO"] = float(os.environ.get("USER_CACHE_VERIFICACAO", 5))
+# Cache das tabelas do index já renderizadas, indexado pela versão "equipamentos": LRU em
+# memória por worker e, com FRAGMENTOS_CACHE_DIR, um diretório partilhado entre workers.
+app.config["FRAGMENTOS_CACHE_MAX"] = int(os.environ.get("FRAGMENTOS_CACHE_MAX", 256))
+app.config["FRAGMENTOS_CACHE_DIR"] = os.environ.get("FRAGMENTOS_CACHE_DIR", "")
+# Atualizações ao vivo (SSE em /eventos): fila por cliente, heartbeat, duração máxima de cada
+# ligação (o navegador reconecta sozinho) e intervalo do polling que traz eventos de outros workers.
+app.config["EVENTOS_FILA_MAX"] = int(os.environ.get("EVENTOS_FILA_MAX", 100))
+app.config["EVENTOS_HEARTBEAT"] = float(os.environ.get("EVENTOS_HEARTBEAT", 15))
+app.config["EVENTOS_DURACAO_MAX"] = float(os.environ.get("EVENTOS_DURACAO_MAX", 300))
+app.config["EVENTOS_POLL_INTERVALO"] = float(os.environ.get("EVENTOS_POLL_INTERVALO", 2))
+# Cada ligação SSE prende uma thread do worker (gthread, gunicorn.conf.py) durante até
+# EVENTOS_DURACAO_MAX segundos: o limite de clientes fica abaixo de GUNICORN_THREADS, com
+# EVENTOS_THREADS_RESERVADAS sempre livres para os restantes pedidos.
+app.config["EVENTOS_THREADS_RESERVADAS"] = int(os.environ.get("EVENTOS_THREADS_RESERVADAS", 4))
+_limite_sse = max(1, int(os.environ.get("GUNICORN_THREADS", 16)) - app.config["EVENTOS_THREADS_RESERVADAS"])
+app.config["EVENTOS_MAX_CLIENTES"] = min(int(os.environ.get("EVENTOS_MAX_CLIENTES", _limite_sse)), _limite_sse)
+# Estáticos servidos por /assets com o hash do conteúdo no nome e cache imutável; respostas
+# HTML/CSS/JSON acima de COMPRESSAO_MINIMO bytes são comprimidas (brotli, se instalado, ou gzip).
+app.config["ASSETS_MAX_AGE"] = int(os.environ.get("ASSETS_MAX_AGE", 365 * 24 * 3600))
+app.config["COMPRESSAO_ATIVA"] = os.environ.get("COMPRESSAO", "1") == "1"
+app.config["COMPRESSAO_MINIMO"] = int(os.environ.get("COMPRESSAO_MINIMO", 1024))
+# Instrumentação por request (desligada por padrão): cabeçalho Server-Timing, agregados em
+# /admin/metrics e slow log dos requests acima de METRICAS_LIMITE_LENTO_MS.
+app.config["METRICAS_ATIVAS"] = os.environ.get("METRICAS", "0") == "1"
+app.config["METRICAS_LIMITE_LENTO_MS"] = float(os.environ.get("METRICAS_LIMITE_LENTO_MS", 1000))
+app.config["METRICAS_JANELA"] = int(os.environ.get("METRICAS_JANELA", 500))
 
 db = SQLAlchemy(app)
+fila_pdf = FilaPdf(
+    app.config["PDF_SPOOL_DIR"],
+    max_workers=app.config["PDF_WORKERS"],
+    max_pendentes=app.config["PDF_MAX_PENDENTES"],
+    ttl=app.config["PDF_SPOOL_TTL"],
+)
+fila_logs = FilaLogs(
+    lambda entradas: gravar_logs_em_lote(entradas),
+    max_itens=app.config["LOG_FILA_MAX"],
+    intervalo=app.config["LOG_FILA_INTERVALO"],
+    logger=app.logger,
+)
+cache_usuarios = CacheLRU(max_itens=app.config["USER_CACHE_MAX"], ttl=app.config["USER_CACHE_TTL"])
+cache_pdf = CachePdf(app.config["PDF_CACHE_DIR"], app.config["PDF_CACHE_MAX_MB"] * 1024 * 1024)
+metricas_requests = MetricasRequests(janela=app.config["METRICAS_JANELA"])
+canal_eventos = CanalEventos(
+    lambda desde: carregar_eventos_desde(desde),
+    lambda: ultimo_evento_id(),
+    max_fila=app.config["EVENTOS_FILA_MAX"],
+    intervalo=app.config["EVENTOS_POLL_INTERVALO"],
+    logger=app.logger,
+)
+manifesto_assets = ManifestoAssets(app.static_folder, recarregar=app.debug)
+cache_fragmentos = CacheFragmentos(
+    max_itens=app.config["FRAGMENTOS_CACHE_MAX"],
+    diretorio=app.config["FRAGMENTOS_CACHE_DIR"],
+)
 
 # -------------------------
 # Flask-Login
@@ -63,8 +222,55 @@ login_manager.login_message_category = "info"
 # -------------------------
 # Helpers e utilitários
 # -------------------------
+MAC_SEPARADORES = re.compile(r"[:\-.\s]")
+MAC_HEX = re.compile(r"[0-9A-Fa-f]+")
+
+def mac_para_inteiro(texto: str) -> Optional[int]:
+    """Valor de 48 bits de um MAC em qualquer formato comum (AA:BB.., aa-bb.., aabb.ccdd..); None se não for MAC."""
+    digitos = MAC_SEPARADORES.sub("", texto or "")
+    if len(digitos) != 12 or not MAC_HEX.fullmatch(digitos):
+        return None
+    return int(digitos, 16)
+
+def formatar_mac(valor: int) -> str:
+    digitos = f"{valor:012X}"
+    return ":".join(digitos[i:i + 2] for i in range(0, 12, 2))
+
+def normalizar_serial(texto: str) -> tuple:
+    """Forma canónica de um serial e o seu MAC em inteiro (ou None, para seriais que não são MAC).
+
+    MACs ficam sempre como AA:BB:CC:DD:EE:FF; os restantes (ex.: FHTT1234ABCD) em maiúsculas.
+    """
+    texto = (texto or "").strip()
+    valor = mac_para_inteiro(texto)
+    if valor is not None:
+        return formatar_mac(valor), valor
+    return texto.upper(), None
+
+def intervalo_prefixo_mac(texto: str) -> Optional[tuple]:
+    """[início, fim) dos MACs que começam por `texto` (6 a 11 dígitos hex, com ou sem separadores)."""
+    digitos = MAC_SEPARADORES.sub("", texto or "")
+    if not 6 <= len(digitos) < 12 or not MAC_HEX.fullmatch(digitos):
+        return None
+    deslocamento = 4 * (12 - len(digitos))
+    valor = int(digitos, 16)
+    return valor << deslocamento, (valor + 1) << deslocamento
+
+def formas_trecho_mac(texto: str) -> list:
+    """Como um trecho de MAC (2 a 11 dígitos hex, com ou sem separadores) aparece no serial canónico.
+
+    O trecho pode começar num dígito par ou ímpar do MAC, por isso há duas formas:
+    "ddee01" → ["DD:EE:01", "D:DE:E0:1"]. Devolve [] se `texto` não for um trecho de MAC.
+    """
+    digitos = MAC_SEPARADORES.sub("", texto or "").upper()
+    if not 2 <= len(digitos) < 12 or not MAC_HEX.fullmatch(digitos):
+        return []
+    em_pares = lambda d: ":".join(d[i:i + 2] for i in range(0, len(d), 2))
+    return [em_pares(digitos), digitos[0] + ":" + em_pares(digitos[1:])]
+
+@lru_cache(maxsize=1)
 def get_logo_base64():
-    """Lê o arquivo de logo e o converte para Base64 para embutir no PDF."""
+    """Lê o arquivo de logo e o converte para Base64 para embutir no PDF (memoizado)."""
     try:
         logo_path = os.path.join(app.root_path, 'static', 'logo.png')
         with open(logo_path, 'rb') as f:
@@ -78,9 +284,16 @@ def get_brasil_datetime():
     brasil_tz = timezone(timedelta(hours=-3))
     return datetime.now(brasil_tz)
 
-def safe_commit() -> bool:
-    """Tenta commitar a sessão; em caso de erro, faz rollback e retorna False."""
+def safe_commit(preparar: Optional[Callable[[], None]] = None) -> bool:
+    """Tenta commitar a sessão; em caso de erro, faz rollback e retorna False.
+
+    `preparar` faz antes do commit as escritas que já vão ao banco (flush, contadores,
+    resumo, eventos): um IntegrityError ou "database is locked" nelas tem o mesmo
+    rollback e o mesmo retorno False que uma falha no próprio commit.
+    """
     try:
+        if preparar is not None:
+            preparar()
         db.session.commit()
         return True
     except Exception as e:
@@ -103,6 +316,105 @@ def format_timedelta(delta: timedelta) -> str:
         return f"{hours}h {minutes}m"
     return f"{minutes}m"
 
+class PaginaKeyset:
+    """Página de resultados obtida por cursor (keyset) sobre uma ou mais colunas decrescentes."""
+
+    def __init__(self, items, cursor_anterior=None, cursor_proximo=None, prefixo="", args=None):
+        self.items = items
+        self.cursor_anterior = cursor_anterior
+        self.cursor_proximo = cursor_proximo
+        self.prefixo = prefixo
+        self.args = args
+
+    @property
+    def has_prev(self) -> bool:
+        return self.cursor_anterior is not None
+
+    @property
+    def has_next(self) -> bool:
+        return self.cursor_proximo is not None
+
+    def _url(self, **cursor) -> str:
+        args = dict(self.args) if self.args is not None else request.args.to_dict()
+        args.pop(f"{self.prefixo}antes", None)
+        args.pop(f"{self.prefixo}depois", None)
+        args.update({f"{self.prefixo}{k}": v for k, v in cursor.items()})
+        return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+    @property
+    def url_anterior(self) -> Optional[str]:
+        return self._url(depois=self.cursor_anterior) if self.has_prev else None
+
+    @property
+    def url_proxima(self) -> Optional[str]:
+        return self._url(antes=self.cursor_proximo) if self.has_next else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+def _ler_cursor(valor: Optional[str], colunas) -> Optional[tuple]:
+    """Converte o cursor da URL ("v1,v2,...") para os tipos Python das colunas."""
+    if not valor:
+        return None
+    partes = valor.split(",")
+    if len(partes) != len(colunas):
+        return None
+    try:
+        return tuple(
+            datetime.fromisoformat(parte) if coluna.type.python_type is datetime else coluna.type.python_type(parte)
+            for parte, coluna in zip(partes, colunas)
+        )
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+def _gerar_cursor(item, colunas) -> str:
+    valores = (getattr(item, coluna.key) for coluna in colunas)
+    return ",".join(v.isoformat() if isinstance(v, datetime) else str(v) for v in valores)
+
+def paginar_keyset(query, *colunas, prefixo: str = "", args: Optional[dict] = None) -> PaginaKeyset:
+    """Pagina `query` por cursor nas `colunas` ("id < último visto") em vez de OFFSET.
+
+    As colunas definem a ordenação (decrescente) e devem identificar a linha de forma
+    única, ex.: `Equipamento.id` ou `(Log.timestamp, Log.id)`. Lê os cursores
+    `<prefixo>antes` / `<prefixo>depois` da query string; o tamanho da página vem de
+    `ITENS_POR_PAGINA` (ou `por_pagina`, limitado a 500). Os links de navegação mantêm os
+    parâmetros de `args` (padrão: toda a query string).
+    """
+    por_pagina = request.args.get("por_pagina", app.config["ITENS_POR_PAGINA"], type=int)
+    por_pagina = max(1, min(por_pagina or app.config["ITENS_POR_PAGINA"], 500))
+    antes = _ler_cursor(request.args.get(f"{prefixo}antes"), colunas)
+    depois = _ler_cursor(request.args.get(f"{prefixo}depois"), colunas)
+    chave = colunas[0] if len(colunas) == 1 else db.tuple_(*colunas)
+
+    def valor(cursor):
+        return cursor[0] if len(colunas) == 1 else db.tuple_(*cursor)
+
+    if depois is not None:
+        linhas = query.filter(chave > valor(depois)).order_by(*(c.asc() for c in colunas)).limit(por_pagina + 1).all()
+        tem_anterior = len(linhas) > por_pagina
+        items = list(reversed(linhas[:por_pagina]))
+        tem_proxima = True
+    else:
+        if antes is not None:
+            query = query.filter(chave < valor(antes))
+        linhas = query.order_by(*(c.desc() for c in colunas)).limit(por_pagina + 1).all()
+        tem_proxima = len(linhas) > por_pagina
+        items = linhas[:por_pagina]
+        tem_anterior = antes is not None
+
+    if not items:
+        return PaginaKeyset(items, prefixo=prefixo, args=args)
+    return PaginaKeyset(
+        items,
+        cursor_anterior=_gerar_cursor(items[0], colunas) if tem_anterior else None,
+        cursor_proximo=_gerar_cursor(items[-1], colunas) if tem_proxima else None,
+        prefixo=prefixo,
+        args=args,
+    )
+
 def admin_required(func):
     """Decorator para restringir acesso a administradores (role='master')."""
     @wraps(func)
@@ -113,18 +425,201 @@ def admin_required(func):
     return wrapper
 
 def add_log(level: str, message: str):
-    """Adiciona um novo registo de log ao banco de dados."""
+    """Adiciona um novo registo de log ao banco de dados.
+
+    Chame antes de `safe_commit()`: o log é gravado junto com a alteração e descartado
+    se ela sofrer rollback. Logs sem commit posterior são gravados no fim do request.
+    """
     try:
-        log_entry = Log(
+        entrada = dict(
+            timestamp=get_brasil_datetime(),
             level=level,
             message=message,
             user_id=current_user.id if current_user.is_authenticated else None
         )
-        db.session.add(log_entry)
-        safe_commit()
+        if app.config["LOG_MODO"] == "fila":
+            g.setdefault("logs_pendentes", []).append(entrada)
+        else:
+            db.session.add(Log(**entrada))
     except Exception as e:
         app.logger.error(f"Falha ao registar log: {e}")
 
+def gravar_logs_em_lote(entradas: list) -> None:
+    """Grava um lote de entradas de log num único INSERT (usado pela FilaLogs)."""
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(Log.__table__.insert(), entradas)
+
+def enfileirar_logs_pendentes() -> None:
+    fila_logs.enfileirar(g.pop("logs_pendentes", []))
+
+# -------------------------
+# Instrumentação de desempenho
+# -------------------------
+METRICAS_PIORES_CONSULTAS = 5
+
+def _medindo() -> bool:
+    return has_request_context() and "metricas" in g
+
+def medir_tempo(campo: str, inicio: float) -> None:
+    """Soma ao `campo` do request atual o tempo decorrido desde `inicio` (time.perf_counter)."""
+    if _medindo():
+        g.metricas[campo] += (time.perf_counter() - inicio) * 1000
+
+def _antes_consulta(conn, cursor, statement, parameters, context, executemany):
+    if _medindo():
+        conn.info["inicio_consulta"] = time.perf_counter()
+
+def _depois_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info.pop("inicio_consulta", None)
+    if inicio is None or not _medindo():
+        return
+    duracao = (time.perf_counter() - inicio) * 1000
+    metricas = g.metricas
+    metricas["sql_n"] += 1
+    metricas["sql_ms"] += duracao
+    # Heap mínimo com as consultas mais lentas do request
+    item = (duracao, metricas["sql_n"], statement)
+    if len(metricas["piores"]) < METRICAS_PIORES_CONSULTAS:
+        heapq.heappush(metricas["piores"], item)
+    else:
+        heapq.heappushpop(metricas["piores"], item)
+
+def _antes_template(sender, template, context, **extra):
+    if _medindo():
+        g.inicio_template = time.perf_counter()
+
+def _template_renderizado(sender, template, context, **extra):
+    if "inicio_template" in g:
+        medir_tempo("tpl_ms", g.pop("inicio_template"))
+
+def iniciar_metricas():
+    g.metricas = {"inicio": time.perf_counter(), "sql_n": 0, "sql_ms": 0.0, "tpl_ms": 0.0, "pdf_ms": 0.0, "piores": []}
+
+def registar_metricas(response):
+    """Publica o Server-Timing e regista a amostra do request (e o slow log, se passar do limite)."""
+    metricas = g.pop("metricas", None)
+    if metricas is None:
+        return response
+    total_ms = (time.perf_counter() - metricas.pop("inicio")) * 1000
+    response.headers["Server-Timing"] = (
+        f'app;dur={total_ms:.1f}, sql;desc="{metricas["sql_n"]} consultas";dur={metricas["sql_ms"]:.1f}, '
+        f'tpl;dur={metricas["tpl_ms"]:.1f}, pdf;dur={metricas["pdf_ms"]:.1f}'
+    )
+    endpoint = request.endpoint or "(sem rota)"
+    metricas_requests.registar(endpoint, dict(metricas, total_ms=total_ms))
+    if total_ms >= app.config["METRICAS_LIMITE_LENTO_MS"]:
+        piores = [(round(duracao, 1), sql) for duracao, _, sql in sorted(metricas["piores"], reverse=True)]
+        metricas_requests.registar_lento({
+            "quando": get_brasil_datetime(),
+            "endpoint": endpoint,
+            "url": request.full_path.rstrip("?"),
+            "status": response.status_code,
+            "total_ms": total_ms,
+            "sql_n": metricas["sql_n"],
+            "sql_ms": metricas["sql_ms"],
+            "piores": piores,
+        })
+        app.logger.warning(
+            "Request lento: %s %.0f ms (%d consultas, %.0f ms de SQL). Piores consultas: %s",
+            request.full_path, total_ms, metricas["sql_n"], metricas["sql_ms"],
+            " | ".join(f"{duracao} ms: {' '.join(sql.split())[:300]}" for duracao, sql in piores),
+        )
+    return response
+
+# Só regista os hooks quando ativa, para não custar nada em produção com METRICAS=0
+if app.config["METRICAS_ATIVAS"]:
+    event.listen(Engine, "before_cursor_execute", _antes_consulta)
+    event.listen(Engine, "after_cursor_execute", _depois_consulta)
+    before_render_template.connect(_antes_template, app)
+    template_rendered.connect(_template_renderizado, app)
+    app.before_request(iniciar_metricas)
+    app.after_request(registar_metricas)
+
+# -------------------------
+# Estáticos e compressão
+# -------------------------
+COMPRESSAO_TIPOS = {"text/html", "text/css", "application/json", "application/javascript", "text/javascript", "image/svg+xml"}
+
+def asset_url(caminho: str) -> str:
+    """URL de um ficheiro de `static` com o hash do conteúdo no nome (ex.: css/base.3f2a1b9c0d.css)."""
+    nome = manifesto_assets.nome(caminho)
+    if nome is None:
+        app.logger.warning("Ficheiro estático inexistente: %s", caminho)
+        return url_for("static", filename=caminho)
+    return url_for("asset", nome=nome)
+
+app.jinja_env.globals["asset_url"] = asset_url
+
+def escolher_codificacao(disponiveis) -> Optional[str]:
+    """Primeira de `disponiveis` aceite pelo cliente (Accept-Encoding com q > 0)."""
+    for codificacao in disponiveis:
+        if request.accept_encodings[codificacao]:
+            return codificacao
+    return None
+
+@app.route("/assets/<path:nome>")
+def asset(nome: str):
+    """Serve um estático pelo nome com hash; as versões .br/.gz de `flask comprimir-assets` têm prioridade."""
+    caminho = manifesto_assets.resolver(nome)
+    if caminho is None:
+        abort(404)
+    arquivo = os.path.join(app.static_folder, caminho)
+    mimetype = mimetypes.guess_type(caminho)[0] or "application/octet-stream"
+    texto = caminho.endswith(EXTENSOES_TEXTO)
+    codificacao, precomprimidos = None, {}
+    if texto and app.config["COMPRESSAO_ATIVA"]:
+        # Só as versões geradas depois da última alteração do original (build desatualizado)
+        modificado = os.path.getmtime(arquivo)
+        precomprimidos = {
+            cod: arquivo + sufixo for sufixo, cod in EXTENSOES_COMPRIMIDAS.items()
+            if os.path.exists(arquivo + sufixo) and os.path.getmtime(arquivo + sufixo) >= modificado
+        }
+        codificacao = escolher_codificacao(
+            cod for cod in ("br", "gzip") if cod in precomprimidos or cod in codificacoes_disponiveis()
+        )
+    if codificacao in precomprimidos:
+        response = send_file(precomprimidos[codificacao], mimetype=mimetype, etag=False)
+    elif codificacao:
+        response = Response(manifesto_assets.comprimido_em_memoria(caminho, codificacao), mimetype=mimetype)
+    else:
+        response = send_file(arquivo, mimetype=mimetype, etag=False)
+    if codificacao:
+        response.headers["Content-Encoding"] = codificacao
+    if texto:
+        response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = f"public, max-age={app.config['ASSETS_MAX_AGE']}, immutable"
+    return response
+
+@app.after_request
+def comprimir_resposta(response):
+    """Comprime HTML/CSS/JSON acima de COMPRESSAO_MINIMO bytes, conforme o Accept-Encoding.
+
+    Ficheiros (send_file) e respostas em streaming (CSV, SSE) passam sem alteração.
+    """
+    if (
+        not app.config["COMPRESSAO_ATIVA"]
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSAO_TIPOS
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    if (response.content_length or 0) < app.config["COMPRESSAO_MINIMO"]:
+        return response
+    codificacao = escolher_codificacao(codificacoes_disponiveis())
+    if codificacao is None:
+        return response
+    response.set_data(comprimir(response.get_data(), codificacao))
+    response.headers["Content-Encoding"] = codificacao
+    etag, fraca = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{codificacao}", weak=fraca)
+    return response
+
 # -------------------------
 # Models
 # -------------------------
@@ -149,16 +644,41 @@ class User(UserMixin, db.Model):
 
 class Equipamento(db.Model):
     __tablename__ = "equipamento"
+    __table_args__ = (
+        db.Index("ix_equipamento_status_id", "status_atual", "id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     tipo = db.Column(db.String(100), nullable=False)
     modelo = db.Column(db.String(100), nullable=False)
-    serial = db.Column(db.String(100), unique=True, nullable=False)
+    serial = db.Column(db.String(100), unique=True, nullable=False)  # forma canónica (normalizar_serial)
+    mac_inteiro = db.Column(db.BigInteger, unique=True, index=True)  # None para seriais que não são MAC
     status_atual = db.Column(db.String(50), default="Aguardando Teste")
     data_cadastro = db.Column(db.DateTime, default=get_brasil_datetime)
     testes = db.relationship("Teste", backref="equipamento", lazy=True, order_by=lambda: Teste.data_teste.desc(), cascade="all, delete-orphan")
+    resumo = db.relationship("EquipamentoResumo", backref="equipamento", uselist=False, lazy="joined", cascade="all, delete-orphan")
+
+class EquipamentoResumo(db.Model):
+    """Resumo desnormalizado do último teste de cada equipamento.
+
+    Evita carregar todo o histórico (e um SELECT por testador) em cada linha das
+    listagens. É mantido por `atualizar_resumo_teste` e reconstruído por `flask rebuild-resumo`.
+    """
+    __tablename__ = "equipamento_resumo"
+    equipamento_id = db.Column(db.Integer, db.ForeignKey("equipamento.id"), primary_key=True)
+    ultimo_teste_id = db.Column(db.Integer)
+    ultimo_teste_data = db.Column(db.DateTime)
+    ultimo_tester_nome = db.Column(db.String(80))
+    ultima_velocidade = db.Column(db.String(50))
+    ultimo_sinal_dbm = db.Column(db.String(50))
+    ultimas_observacoes = db.Column(db.String(300))
+    total_testes = db.Column(db.Integer, nullable=False, default=0)
 
 class Teste(db.Model):
     __tablename__ = "teste"
+    __table_args__ = (
+        db.Index("ix_teste_equipamento_data", "equipamento_id", "data_teste"),
+        db.Index("ix_teste_data_teste", "data_teste"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     data_teste = db.Column(db.DateTime, default=get_brasil_datetime)
     status = db.Column(db.String(50), nullable=False)
@@ -170,6 +690,9 @@ class Teste(db.Model):
 
 class Log(db.Model):
     __tablename__ = "log"
+    __table_args__ = (
+        db.Index("ix_log_timestamp", "timestamp"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=get_brasil_datetime, nullable=False)
     level = db.Column(db.String(20), nullable=False) # INFO, SUCCESS, WARNING, DANGER
@@ -177,15 +700,318 @@ class Log(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
 
 
+# Índice FTS5 (trigram) sobre serial/modelo/tipo: permite buscar substrings (ex.: parte
+# de um MAC) sem o full scan de um LIKE '%termo%'. Mantido por triggers no próprio SQLite.
+BUSCA_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS equipamento_fts USING fts5("
+    "serial, modelo, tipo, content='equipamento', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS equipamento_fts_ai AFTER INSERT ON equipamento BEGIN "
+    "INSERT INTO equipamento_fts(rowid, serial, modelo, tipo) VALUES (new.id, new.serial, new.modelo, new.tipo); END",
+    "CREATE TRIGGER IF NOT EXISTS equipamento_fts_ad AFTER DELETE ON equipamento BEGIN "
+    "INSERT INTO equipamento_fts(equipamento_fts, rowid, serial, modelo, tipo) "
+    "VALUES ('delete', old.id, old.serial, old.modelo, old.tipo); END",
+    "CREATE TRIGGER IF NOT EXISTS equipamento_fts_au AFTER UPDATE OF serial, modelo, tipo ON equipamento BEGIN "
+    "INSERT INTO equipamento_fts(equipamento_fts, rowid, serial, modelo, tipo) "
+    "VALUES ('delete', old.id, old.serial, old.modelo, old.tipo); "
+    "INSERT INTO equipamento_fts(rowid, serial, modelo, tipo) VALUES (new.id, new.serial, new.modelo, new.tipo); END",
+]
+for _ddl in BUSCA_FTS_DDL:
+    event.listen(Equipamento.__table__, "after_create", DDL(_ddl).execute_if(dialect="sqlite"))
+
+_busca_fts_disponivel: Optional[bool] = None
+
+def busca_fts_disponivel() -> bool:
+    """Indica se o índice equipamento_fts existe (verificado uma vez por processo)."""
+    global _busca_fts_disponivel
+    if _busca_fts_disponivel is None:
+        _busca_fts_disponivel = (
+            db.engine.dialect.name == "sqlite"
+            and db.inspect(db.engine).has_table("equipamento_fts")
+        )
+    return _busca_fts_disponivel
+
+class ApiToken(db.Model):
+    """Token de acesso à API (bancadas de teste automáticas). Guarda-se apenas o hash SHA-256."""
+    __tablename__ = "api_token"
+    id = db.Column(db.Integer, primary_key=True)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    descricao = db.Column(db.String(100))
+    criado_em = db.Column(db.DateTime, default=get_brasil_datetime)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user = db.relationship('User', backref=db.backref('api_tokens', cascade="all, delete-orphan"))
+
+    @staticmethod
+    def gerar_hash(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+class VersaoDados(db.Model):
+    """Contadores de versão dos dados, incrementados a cada escrita para invalidar caches."""
+    __tablename__ = "versao_dados"
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Integer, nullable=False, default=0)
+
+def incrementar_versao(nome: str) -> None:
+    """Incrementa o contador `nome` na transação atual (commit fica a cargo de quem chama)."""
+    atualizados = db.session.execute(
+        db.update(VersaoDados).where(VersaoDados.nome == nome).values(valor=VersaoDados.valor + 1)
+    ).rowcount
+    if not atualizados:
+        try:
+            with db.session.begin_nested():
+                db.session.add(VersaoDados(nome=nome, valor=1))
+        except IntegrityError:
+            # Outro worker criou o contador entre o UPDATE e o INSERT
+            db.session.execute(
+                db.update(VersaoDados).where(VersaoDados.nome == nome).values(valor=VersaoDados.valor + 1)
+            )
+
+def obter_versao(nome: str) -> int:
+    return db.session.query(VersaoDados.valor).filter_by(nome=nome).scalar() or 0
+
+STATUS_CADASTRO = "Cadastrado"  # entradas de equipamento novo na tabela de contagens
+
+class ContagemDiaria(db.Model):
+    """Contagens agregadas por dia × status × utilizador × modelo, para o painel /stats.
+
+    Os testes contam pelo seu status e os cadastros de equipamentos novos como
+    STATUS_CADASTRO com user_id 0 (o equipamento não guarda quem o registou). É mantida
+    por `contabilizar` na mesma transação de cada escrita e reconstruída por
+    `flask rebuild-contagens`.
+    """
+    __tablename__ = "contagem_diaria"
+    dia = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    modelo = db.Column(db.String(100), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+def contabilizar(contagens: dict) -> None:
+    """Soma `{(dia, status, user_id, modelo): delta}` às contagens, na transação atual."""
+    for (dia, status, user_id, modelo), delta in contagens.items():
+        if not delta:
+            continue
+        atualizar = (
+            db.update(ContagemDiaria)
+            .where(
+                ContagemDiaria.dia == dia, ContagemDiaria.status == status,
+                ContagemDiaria.user_id == user_id, ContagemDiaria.modelo == modelo,
+            )
+            .values(total=ContagemDiaria.total + delta)
+            .execution_options(synchronize_session=False)
+        )
+        if not db.session.execute(atualizar).rowcount:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(db.insert(ContagemDiaria).values(
+                        dia=dia, status=status, user_id=user_id, modelo=modelo, total=delta
+                    ))
+            except IntegrityError:
+                # Outro worker criou a linha entre o UPDATE e o INSERT
+                db.session.execute(atualizar)
+
+def atualizar_resumo_teste(equipamento: Equipamento, teste: Teste, tester_nome: str) -> None:
+    """Regista `teste` como o último teste do equipamento, na mesma transação do teste."""
+    db.session.flush()  # garante teste.id antes do commit
+    resumo = equipamento.resumo
+    if resumo is None:
+        resumo = EquipamentoResumo(total_testes=1)
+        equipamento.resumo = resumo
+    else:
+        resumo.total_testes = EquipamentoResumo.total_testes + 1
+    resumo.ultimo_teste_id = teste.id
+    resumo.ultimo_teste_data = teste.data_teste
+    resumo.ultimo_tester_nome = tester_nome
+    resumo.ultima_velocidade = teste.velocidade_teste
+    resumo.ultimo_sinal_dbm = teste.sinal_dbm
+    resumo.ultimas_observacoes = teste.observacoes
+
+EVENTOS_REPLAY_MAX = 200  # eventos reenviados a um cliente que reconecta com Last-Event-ID
+EVENTOS_LOTE_MAX = 200  # acima disto um lote gera um único evento "recarregar"
+
+class EventoAlteracao(db.Model):
+    """Alterações de equipamentos enviadas aos clientes ligados em /eventos.
+
+    Gravada na mesma transação da alteração; o id serve de Last-Event-ID e permite aos
+    outros workers apanhar, por polling, o que foi gravado fora do seu processo.
+    Limpa por `flask clean-eventos`.
+    """
+    __tablename__ = "evento_alteracao"
+    id = db.Column(db.Integer, primary_key=True)
+    criado_em = db.Column(db.DateTime, default=get_brasil_datetime, index=True)
+    dados = db.Column(db.Text, nullable=False)
+
+    def para_dict(self) -> dict:
+        return dict(json.loads(self.dados), id=self.id)
+
+def dados_equipamento(equipamento: Equipamento) -> dict:
+    if equipamento.id is None:
+        db.session.flush()
+    return {
+        "equipamento_id": equipamento.id,
+        "serial": equipamento.serial,
+        "tipo": equipamento.tipo,
+        "modelo": equipamento.modelo,
+    }
+
+def registar_evento(acao: str, **dados) -> None:
+    """Grava um evento de alteração na transação atual; é publicado após o commit."""
+    dados["acao"] = acao
+    dados.setdefault("data", get_brasil_datetime().strftime("%d/%m/%Y %H:%M"))
+    db.session.add(EventoAlteracao(dados=json.dumps(dados, ensure_ascii=False)))
+
+def carregar_eventos_desde(desde: int, limite: int = EVENTOS_REPLAY_MAX) -> list:
+    with app.app_context():
+        eventos = (
+            EventoAlteracao.query.filter(EventoAlteracao.id > desde)
+            .order_by(EventoAlteracao.id).limit(limite).all()
+        )
+        return [evento.para_dict() for evento in eventos]
+
+def ultimo_evento_id() -> int:
+    with app.app_context():
+        return db.session.query(db.func.max(EventoAlteracao.id)).scalar() or 0
+
+
+@event.listens_for(db.session, "after_commit")
+def _logs_apos_commit(session):
+    if app.config["LOG_MODO"] == "fila" and has_app_context():
+        enfileirar_logs_pendentes()
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _descartar_logs_pendentes(session, previous_transaction):
+    # O rollback de um savepoint (begin_nested) não desfaz a transação principal
+    if has_app_context() and not previous_transaction.nested:
+        g.pop("logs_pendentes", None)
+
+@event.listens_for(db.session, "after_flush")
+def _guardar_eventos_pendentes(session, flush_context):
+    # Os ids já estão atribuídos aqui; depois do commit os objetos estão expirados
+    eventos = [obj.para_dict() for obj in session.new if isinstance(obj, EventoAlteracao)]
+    if eventos:
+        session.info.setdefault("eventos_pendentes", []).extend(eventos)
+
+@event.listens_for(db.session, "after_commit")
+def _publicar_eventos(session):
+    eventos = session.info.pop("eventos_pendentes", None)
+    if eventos:
+        canal_eventos.publicar(sorted(eventos, key=lambda evento: evento["id"]))
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _descartar_eventos_pendentes(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop("eventos_pendentes", None)
+
+@app.after_request
+def gravar_logs_pendentes(response):
+    """Grava os logs que não foram incluídos em nenhum commit durante o request."""
+    if app.config["LOG_MODO"] == "fila":
+        enfileirar_logs_pendentes()
+    elif any(isinstance(obj, Log) for obj in db.session.new):
+        safe_commit()
+    return response
+
+
+def atualizar_resumos_em_lote(linhas: list, ids_teste: list, tester_nome: str) -> None:
+    """Versão em lote de `atualizar_resumo_teste` para testes inseridos via INSERT em massa."""
+    ultimos, contagem = {}, {}
+    for linha, teste_id in zip(linhas, ids_teste):
+        ultimos[linha["equipamento_id"]] = (linha, teste_id)
+        contagem[linha["equipamento_id"]] = contagem.get(linha["equipamento_id"], 0) + 1
+    existentes = {}
+    for parte in em_partes(list(ultimos)):
+        existentes.update(
+            db.session.query(EquipamentoResumo.equipamento_id, EquipamentoResumo.total_testes)
+            .filter(EquipamentoResumo.equipamento_id.in_(parte)).all()
+        )
+    novos, atualizados = [], []
+    for equip_id, (linha, teste_id) in ultimos.items():
+        resumo = {
+            "equipamento_id": equip_id,
+            "ultimo_teste_id": teste_id,
+            "ultimo_teste_data": linha["data_teste"],
+            "ultimo_tester_nome": tester_nome,
+            "ultima_velocidade": linha["velocidade_teste"],
+            "ultimo_sinal_dbm": linha["sinal_dbm"],
+            "ultimas_observacoes": linha["observacoes"],
+            "total_testes": (existentes.get(equip_id) or 0) + contagem[equip_id],
+        }
+        (atualizados if equip_id in existentes else novos).append(resumo)
+    if novos:
+        db.session.execute(db.insert(EquipamentoResumo), novos)
+    if atualizados:
+        db.session.execute(db.update(EquipamentoResumo), atualizados)
+
+
 # -------------------------
 # Autoload de usuário
 # -------------------------
+class UsuarioSessao(UserMixin):
+    """Identidade e role do utilizador logado, servida pelo cache (sem ligação ao banco)."""
+
+    def __init__(self, id: int, username: str, role: str):
+        self.id = id
+        self.username = username
+        self.role = role
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "master"
+
+_versao_usuarios = {"valor": None, "verificado_em": 0.0}
+
+def sincronizar_cache_usuarios() -> None:
+    """Limpa o cache local se outro worker alterou utilizadores (verificação periódica)."""
+    agora = time.monotonic()
+    if agora - _versao_usuarios["verificado_em"] < app.config["USER_CACHE_VERIFICACAO"]:
+        return
+    versao = obter_versao("usuarios")
+    if versao != _versao_usuarios["valor"]:
+        cache_usuarios.limpar()
+        _versao_usuarios["valor"] = versao
+    _versao_usuarios["verificado_em"] = agora
+
+def invalidar_cache_usuarios() -> None:
+    """Marca os utilizadores como alterados para todos os workers (chamar antes do commit)."""
+    incrementar_versao("usuarios")
+    cache_usuarios.limpar()
+
 @login_manager.user_loader
-def load_user(user_id: str) -> Optional[User]:
+def load_user(user_id: str) -> Optional[UsuarioSessao]:
     try:
-        return User.query.get(int(user_id))
+        user_id = int(user_id)
     except (ValueError, TypeError):
         return None
+    sincronizar_cache_usuarios()
+    usuario = cache_usuarios.obter(user_id)
+    if usuario is None:
+        linha = db.session.query(User.id, User.username, User.role).filter_by(id=user_id).first()
+        if linha is None:
+            return None
+        usuario = UsuarioSessao(linha.id, linha.username, linha.role)
+        cache_usuarios.guardar(user_id, usuario)
+    return usuario
+
+@login_manager.request_loader
+def load_user_from_request(req) -> Optional[User]:
+    """Autentica chamadas à API (/api/...) pelo cabeçalho `Authorization: Bearer <token>`."""
+    if not req.path.startswith("/api/"):
+        return None
+    auth = req.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        return None
+    api_token = ApiToken.query.filter_by(token_hash=ApiToken.gerar_hash(auth[len("Bearer "):].strip())).first()
+    return api_token.user if api_token else None
+
+def api_login_required(func):
+    """Como login_required, mas responde 401/403 em JSON em vez de redirecionar para o login."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return jsonify(erro="Token de API ausente ou inválido."), 401
+        if current_user.role == 'agendamento':
+            return jsonify(erro="Utilizador sem permissão para registar testes."), 403
+        return func(*args, **kwargs)
+    return wrapper
 
 # -------------------------
 # Rotas de autenticação
@@ -219,36 +1045,59 @@ def logout():
 # -------------------------
 # Rotas principais
 # -------------------------
+INDEX_PARAMETROS = ("por_pagina", "aguardando_antes", "aguardando_depois", "testados_antes", "testados_depois")
+
 @app.route("/")
 @login_required
 def index():
     if current_user.role == 'agendamento':
         return redirect(url_for('pesquisar'))
     
-    equipamentos_nao_testados = Equipamento.query.filter_by(status_atual="Aguardando Teste").order_by(Equipamento.id.desc()).all()
-    equipamentos_testados = Equipamento.query.filter(Equipamento.status_atual != "Aguardando Teste").order_by(Equipamento.id.desc()).all()
-    
-    return render_template(
-        "index.html",
-        equipamentos_nao_testados=equipamentos_nao_testados,
-        equipamentos_testados=equipamentos_testados
-    )
+    # As tabelas só mudam com escritas (que incrementam a versão "equipamentos") e não
+    # dependem do utilizador; o cabeçalho e as mensagens flash são sempre renderizados.
+    # A versão é lida antes dos dados, por isso o fragmento nunca é mais antigo que a chave.
+    # A chave (e os links de paginação do fragmento) usam só os parâmetros que a página lê,
+    # por ordem fixa: parâmetros extra não criam entradas novas no cache.
+    versao = obter_versao("equipamentos")
+    parametros = {nome: request.args[nome] for nome in INDEX_PARAMETROS if request.args.get(nome)}
+    chave = f"index?{urlencode(parametros)}"
+    tabelas = cache_fragmentos.obter(versao, chave)
+    if tabelas is None:
+        query_nao_testados = Equipamento.query.filter_by(status_atual="Aguardando Teste")
+        query_testados = Equipamento.query.filter(Equipamento.status_atual != "Aguardando Teste")
+        tabelas = render_template(
+            "index_tabelas.html",
+            equipamentos_nao_testados=paginar_keyset(query_nao_testados, Equipamento.id, prefixo="aguardando_", args=parametros),
+            equipamentos_testados=paginar_keyset(query_testados, Equipamento.id, prefixo="testados_", args=parametros),
+            total_nao_testados=query_nao_testados.order_by(None).count(),
+            total_testados=query_testados.order_by(None).count(),
+        )
+        cache_fragmentos.guardar(versao, chave, tabelas)
+    return render_template("index.html", tabelas=tabelas)
 
 @app.route("/add_equipamento", methods=["POST"])
 @login_required
 def add_equipamento():
     if current_user.role == 'agendamento': abort(403)
-    serial = (request.form.get("serial") or "").strip()
+    serial, mac = normalizar_serial(request.form.get("serial"))
     
     if not serial:
         flash("O campo MAC é obrigatório.", "danger")
         return redirect(url_for("index"))
 
-    existente = Equipamento.query.filter_by(serial=serial).first()
+    if mac is not None:
+        existente = Equipamento.query.filter_by(mac_inteiro=mac).first()
+    else:
+        existente = Equipamento.query.filter_by(serial=serial).first()
     if existente:
-        existente.status_atual = "Aguardando Teste"
-        if safe_commit():
-            add_log("INFO", f"Solicitado re-teste para equipamento: {serial}.")
+        status_anterior = existente.status_atual
+
+        def gravar():
+            existente.status_atual = "Aguardando Teste"
+            registar_evento("reteste", status="Aguardando Teste", status_anterior=status_anterior, **dados_equipamento(existente))
+            incrementar_versao("equipamentos")
+        add_log("INFO", f"Solicitado re-teste para equipamento: {serial}.")
+        if safe_commit(gravar):
             flash(f'Equipamento "{serial}" pronto para re-teste na aba "Aguardando Teste".', "info")
         else:
             add_log("DANGER", f"Falha ao solicitar re-teste para: {serial}.")
@@ -260,10 +1109,16 @@ def add_equipamento():
             flash("Para um equipamento novo, Tipo e Modelo também são obrigatórios.", "danger")
             return redirect(url_for("index"))
             
-        novo = Equipamento(serial=serial, tipo=tipo, modelo=modelo)
-        db.session.add(novo)
-        if safe_commit():
-            add_log("SUCCESS", f"Novo equipamento registado: {serial} ({tipo}/{modelo}).")
+        agora = get_brasil_datetime()
+        novo = Equipamento(serial=serial, mac_inteiro=mac, tipo=tipo, modelo=modelo, data_cadastro=agora)
+
+        def gravar():
+            db.session.add(novo)
+            contabilizar({(agora.date(), STATUS_CADASTRO, 0, modelo): 1})
+            registar_evento("novo", status="Aguardando Teste", status_anterior=None, **dados_equipamento(novo))
+            incrementar_versao("equipamentos")
+        add_log("SUCCESS", f"Novo equipamento registado: {serial} ({tipo}/{modelo}).")
+        if safe_commit(gravar):
             flash(f'Novo equipamento "{serial}" registado! Ele está na aba "Aguardando Teste".', "success")
         else:
             add_log("DANGER", f"Falha ao registar novo equipamento: {serial}.")
@@ -271,6 +1126,138 @@ def add_equipamento():
             
     return redirect(url_for("index"))
 
+LOTE_MAX_LINHAS = 5000
+LOTE_TAMANHO_IN = 500  # serials por cláusula IN (limite de parâmetros do SQLite)
+
+def em_partes(itens: list, tamanho: int = LOTE_TAMANHO_IN):
+    for i in range(0, len(itens), tamanho):
+        yield itens[i:i + tamanho]
+
+def ids_por_serial(serials) -> dict:
+    """Resolve serial canónico -> id dos equipamentos existentes com consultas IN em partes.
+
+    Os MACs são procurados pelo índice de mac_inteiro; os outros seriais, pelo texto.
+    """
+    macs, outros = {}, []
+    for serial in serials:
+        valor = mac_para_inteiro(serial)
+        if valor is None:
+            outros.append(serial)
+        else:
+            macs[valor] = serial
+    encontrados = {}
+    for parte in em_partes(list(macs)):
+        for valor, equip_id in db.session.query(Equipamento.mac_inteiro, Equipamento.id).filter(Equipamento.mac_inteiro.in_(parte)):
+            encontrados[macs[valor]] = equip_id
+    for parte in em_partes(outros):
+        encontrados.update(db.session.query(Equipamento.serial, Equipamento.id).filter(Equipamento.serial.in_(parte)).all())
+    return encontrados
+
+def ler_linhas_lote(texto: str) -> list:
+    """Lê linhas "serial[;tipo;modelo]" (separador ; , ou tab) e devolve (nº linha, campos)."""
+    linhas = []
+    for numero, linha in enumerate(texto.splitlines(), 1):
+        linha = linha.strip()
+        if not linha or linha.startswith("#"):
+            continue
+        separador = ";" if ";" in linha else "\t" if "\t" in linha else ","
+        campos = [c.strip() for c in next(csv.reader([linha], delimiter=separador))]
+        linhas.append((numero, campos))
+    return linhas
+
+@app.route("/add_equipamento/lote", methods=["GET", "POST"])
+@login_required
+def add_equipamento_lote():
+    """Entrada em lote (ex.: um palete de ONTs): cadastra os MACs novos e põe os existentes em re-teste."""
+    if current_user.role == 'agendamento': abort(403)
+    if request.method == "GET":
+        return render_template("lote_equipamentos.html")
+
+    texto = request.form.get("linhas", "")
+    arquivo = request.files.get("arquivo")
+    if arquivo and arquivo.filename:
+        texto += "\n" + arquivo.read().decode("utf-8-sig", errors="replace")
+    tipo_padrao = (request.form.get("tipo") or "").strip()
+    modelo_padrao = (request.form.get("modelo") or "").strip()
+
+    linhas = ler_linhas_lote(texto)
+    if not linhas:
+        flash("Nenhum MAC informado.", "danger")
+        return redirect(url_for("add_equipamento_lote"))
+    if len(linhas) > LOTE_MAX_LINHAS:
+        flash(f"O lote excede o limite de {LOTE_MAX_LINHAS} linhas.", "danger")
+        return redirect(url_for("add_equipamento_lote"))
+
+    linhas = [(numero, campos, normalizar_serial(campos[0] if campos else "")) for numero, campos in linhas]
+    existentes = ids_por_serial({serial for _, _, (serial, _) in linhas if serial})
+    agora = get_brasil_datetime()
+
+    resultados, novos, reteste_ids, vistos = [], [], [], set()
+    for numero, campos, (serial, mac) in linhas:
+        tipo = (campos[1] if len(campos) > 1 else "") or tipo_padrao
+        modelo = (campos[2] if len(campos) > 2 else "") or modelo_padrao
+        if not serial:
+            resultados.append((numero, serial, "erro", "MAC em branco."))
+        elif serial in vistos:
+            resultados.append((numero, serial, "ignorado", "MAC repetido no lote."))
+        elif serial in existentes:
+            reteste_ids.append(existentes[serial])
+            resultados.append((numero, serial, "reteste", "Enviado para re-teste."))
+        elif not tipo or not modelo:
+            resultados.append((numero, serial, "erro", "Equipamento novo sem Tipo/Modelo."))
+        else:
+            novos.append({"serial": serial, "mac_inteiro": mac, "tipo": tipo, "modelo": modelo, "status_atual": "Aguardando Teste", "data_cadastro": agora})
+            resultados.append((numero, serial, "novo", f"Registado ({tipo}/{modelo})."))
+        vistos.add(serial)
+
+    eventos_por_item = len(novos) + len(reteste_ids) <= EVENTOS_LOTE_MAX
+    anteriores = []
+    if eventos_por_item:
+        for parte in em_partes(reteste_ids):
+            anteriores += db.session.query(
+                Equipamento.id, Equipamento.serial, Equipamento.tipo, Equipamento.modelo, Equipamento.status_atual
+            ).filter(Equipamento.id.in_(parte)).all()
+
+    def gravar():
+        if novos:
+            db.session.execute(db.insert(Equipamento), novos)
+            contagens = {}
+            for equipamento in novos:
+                chave = (agora.date(), STATUS_CADASTRO, 0, equipamento["modelo"])
+                contagens[chave] = contagens.get(chave, 0) + 1
+            contabilizar(contagens)
+        for parte in em_partes(reteste_ids):
+            db.session.execute(
+                db.update(Equipamento)
+                .where(Equipamento.id.in_(parte))
+                .values(status_atual="Aguardando Teste")
+                .execution_options(synchronize_session=False)
+            )
+        if eventos_por_item:
+            for equip_id, serial, tipo, modelo, status_anterior in anteriores:
+                registar_evento("reteste", status="Aguardando Teste", status_anterior=status_anterior,
+                                equipamento_id=equip_id, serial=serial, tipo=tipo, modelo=modelo)
+            novos_ids = ids_por_serial(equipamento["serial"] for equipamento in novos) if novos else {}
+            for equipamento in novos:
+                registar_evento("novo", status="Aguardando Teste", status_anterior=None,
+                                equipamento_id=novos_ids[equipamento["serial"]], serial=equipamento["serial"],
+                                tipo=equipamento["tipo"], modelo=equipamento["modelo"])
+        else:
+            registar_evento("recarregar")
+        incrementar_versao("equipamentos")
+    erros = sum(1 for r in resultados if r[2] == "erro")
+    if novos or reteste_ids:
+        add_log("SUCCESS", f"Entrada em lote: {len(novos)} novo(s), {len(reteste_ids)} re-teste(s), {erros} erro(s).")
+        if safe_commit(gravar):
+            flash(f"Lote processado: {len(novos)} novo(s), {len(reteste_ids)} para re-teste, {erros} com erro.", "success")
+        else:
+            add_log("DANGER", f"Falha na entrada em lote de {len(linhas)} linha(s).")
+            flash("Erro ao gravar o lote; nenhum equipamento foi alterado.", "danger")
+            resultados = [(n, serial, "erro", "Lote não gravado.") for n, serial, _, _ in resultados]
+    else:
+        flash("Nenhum equipamento foi alterado.", "warning")
+    return render_template("lote_equipamentos.html", resultados=resultados)
+
 @app.route("/add_test/<int:equip_id>", methods=["POST"])
 @login_required
 def add_test(equip_id: int):
@@ -290,10 +1277,21 @@ def add_test(equip_id: int):
         equipamento=equipamento,
         user_id=current_user.id
     )
-    equipamento.status_atual = status
-    db.session.add(novo)
-    if safe_commit():
-        add_log("SUCCESS", f"Teste '{status}' registado para equipamento: {equipamento.serial}.")
+    status_anterior = equipamento.status_atual
+
+    def gravar():
+        equipamento.status_atual = status
+        db.session.add(novo)
+        atualizar_resumo_teste(equipamento, novo, current_user.username)
+        contabilizar({(novo.data_teste.date(), status, current_user.id, equipamento.modelo): 1})
+        registar_evento(
+            "teste", status=status, status_anterior=status_anterior, testes=1, tester=current_user.username,
+            velocidade=novo.velocidade_teste, sinal=novo.sinal_dbm, observacoes=novo.observacoes,
+            **dados_equipamento(equipamento),
+        )
+        incrementar_versao("equipamentos")
+    add_log("SUCCESS", f"Teste '{status}' registado para equipamento: {equipamento.serial}.")
+    if safe_commit(gravar):
         flash(f'Teste para "{equipamento.serial}" salvo com sucesso!', "success")
     else:
         add_log("DANGER", f"Falha ao salvar teste para: {equipamento.serial}.")
@@ -301,6 +1299,102 @@ def add_test(equip_id: int):
     return redirect(url_for("index"))
 
 
+API_LOTE_MAX = 5000
+STATUS_TESTE = ("Aprovado", "Reprovado")
+
+@app.route("/api/testes/lote", methods=["POST"])
+@api_login_required
+def api_testes_lote():
+    """Regista em lote resultados de teste enviados pelas bancadas automáticas.
+
+    Corpo JSON: `{"resultados": [{"serial", "status", "velocidade_teste", "sinal_dbm",
+    "observacoes"}, ...]}` (ou a lista diretamente). Tudo é gravado num único commit;
+    os itens inválidos são devolvidos em `erros` e não impedem os restantes.
+    """
+    corpo = request.get_json(silent=True)
+    resultados = corpo.get("resultados") if isinstance(corpo, dict) else corpo
+    if not isinstance(resultados, list) or not resultados:
+        return jsonify(erro="Envie uma lista não vazia em 'resultados'."), 400
+    if len(resultados) > API_LOTE_MAX:
+        return jsonify(erro=f"O lote excede o limite de {API_LOTE_MAX} resultados."), 413
+
+    erros, validos = [], []
+    for indice, item in enumerate(resultados):
+        if not isinstance(item, dict):
+            erros.append({"indice": indice, "erro": "Item inválido."})
+            continue
+        serial = normalizar_serial(str(item.get("serial") or ""))[0]
+        status = str(item.get("status") or "").strip()
+        if not serial or status not in STATUS_TESTE:
+            erros.append({"indice": indice, "serial": serial, "erro": f"'serial' e 'status' ({'/'.join(STATUS_TESTE)}) são obrigatórios."})
+            continue
+        validos.append((indice, serial, status, item))
+
+    equipamentos = ids_por_serial({serial for _, serial, _, _ in validos})
+    anteriores = {}
+    for parte in em_partes(list(set(equipamentos.values()))):
+        for linha in db.session.query(
+            Equipamento.id, Equipamento.serial, Equipamento.tipo, Equipamento.modelo, Equipamento.status_atual
+        ).filter(Equipamento.id.in_(parte)):
+            anteriores[linha.id] = linha
+    agora = get_brasil_datetime()
+    linhas = []
+    for indice, serial, status, item in validos:
+        if serial not in equipamentos:
+            erros.append({"indice": indice, "serial": serial, "erro": "Equipamento não cadastrado."})
+            continue
+        linhas.append({
+            "equipamento_id": equipamentos[serial],
+            "user_id": current_user.id,
+            "data_teste": agora,
+            "status": status,
+            "velocidade_teste": None if item.get("velocidade_teste") is None else str(item["velocidade_teste"]),
+            "sinal_dbm": None if item.get("sinal_dbm") is None else str(item["sinal_dbm"]),
+            "observacoes": (str(item["observacoes"])[:300] if item.get("observacoes") else None),
+        })
+    if not linhas:
+        return jsonify(gravados=0, erros=erros), 422
+
+    ultimo_status = {linha["equipamento_id"]: linha["status"] for linha in linhas}
+
+    def gravar():
+        ids_teste = db.session.execute(db.insert(Teste).returning(Teste.id, sort_by_parameter_order=True), linhas).scalars().all()
+        atualizar_resumos_em_lote(linhas, ids_teste, current_user.username)
+        contagens = {}
+        for linha in linhas:
+            chave = (agora.date(), linha["status"], current_user.id, anteriores[linha["equipamento_id"]].modelo)
+            contagens[chave] = contagens.get(chave, 0) + 1
+        contabilizar(contagens)
+        for status in set(ultimo_status.values()):
+            ids = [equip_id for equip_id, s in ultimo_status.items() if s == status]
+            for parte in em_partes(ids):
+                db.session.execute(
+                    db.update(Equipamento).where(Equipamento.id.in_(parte)).values(status_atual=status)
+                    .execution_options(synchronize_session=False)
+                )
+        if len(ultimo_status) <= EVENTOS_LOTE_MAX:
+            testes_por_equipamento = {}
+            for linha in linhas:
+                testes_por_equipamento[linha["equipamento_id"]] = testes_por_equipamento.get(linha["equipamento_id"], 0) + 1
+            ultimas = {linha["equipamento_id"]: linha for linha in linhas}
+            for equip_id, linha in ultimas.items():
+                anterior = anteriores[equip_id]
+                registar_evento(
+                    "teste", status=linha["status"], status_anterior=anterior.status_atual,
+                    testes=testes_por_equipamento[equip_id], tester=current_user.username,
+                    velocidade=linha["velocidade_teste"], sinal=linha["sinal_dbm"], observacoes=linha["observacoes"],
+                    equipamento_id=equip_id, serial=anterior.serial, tipo=anterior.tipo, modelo=anterior.modelo,
+                )
+        else:
+            registar_evento("recarregar")
+        incrementar_versao("equipamentos")
+    add_log("SUCCESS", f"API: {len(linhas)} teste(s) registado(s) em lote para {len(ultimo_status)} equipamento(s).")
+    if not safe_commit(gravar):
+        add_log("DANGER", f"API: falha ao registar lote de {len(linhas)} teste(s).")
+        return jsonify(erro="Erro ao gravar o lote; nenhum teste foi registado."), 500
+    return jsonify(gravados=len(linhas), erros=erros), 201
+
+
 # -------------------------
 # Pesquisa, histórico e exclusões
 # -------------------------
@@ -312,19 +1406,44 @@ def get_filtered_equipamentos_query(base_query):
     if filtro_status:
         base_query = base_query.filter(Equipamento.status_atual == filtro_status)
     if filtro_dia or filtro_mes:
-        base_query = base_query.join(Teste)
+        # Intervalo semiaberto [inicio, fim) sobre a coluna crua, para que o índice
+        # ix_teste_data_teste seja usado; o IN (subquery) evita linhas duplicadas
+        # de equipamentos com vários testes no período.
         try:
             if filtro_dia:
-                dia = datetime.strptime(filtro_dia, "%Y-%m-%d").date()
-                base_query = base_query.filter(db.func.date(Teste.data_teste) == dia)
-            elif filtro_mes:
-                mes_dt = datetime.strptime(filtro_mes, "%Y-%m")
-                base_query = base_query.filter(db.extract("year", Teste.data_teste) == mes_dt.year, db.extract("month", Teste.data_teste) == mes_dt.month)
+                inicio = datetime.strptime(filtro_dia, "%Y-%m-%d")
+                fim = inicio + timedelta(days=1)
+            else:
+                inicio = datetime.strptime(filtro_mes, "%Y-%m")
+                fim = inicio.replace(year=inicio.year + 1, month=1) if inicio.month == 12 else inicio.replace(month=inicio.month + 1)
+            testes_no_periodo = db.select(Teste.equipamento_id).where(Teste.data_teste >= inicio, Teste.data_teste < fim)
+            base_query = base_query.filter(Equipamento.id.in_(testes_no_periodo))
         except (ValueError, TypeError):
             app.logger.warning("Filtro de data inválido: %s / %s", filtro_dia, filtro_mes)
-    if query_busca:
-        termo = f"%{query_busca}%"
-        base_query = base_query.filter(or_(Equipamento.serial.ilike(termo), Equipamento.modelo.ilike(termo), Equipamento.tipo.ilike(termo)))
+    mac = mac_para_inteiro(query_busca)
+    if mac is not None:
+        # MAC completo, em qualquer formato: consulta pontual no índice de mac_inteiro
+        base_query = base_query.filter(Equipamento.mac_inteiro == mac)
+    elif query_busca:
+        # Os MACs estão gravados como AA:BB:CC:DD:EE:FF: um trecho sem separadores ("ddee01")
+        # também é procurado nas formas com ':' em que pode aparecer no serial.
+        termos = list(dict.fromkeys([query_busca] + formas_trecho_mac(query_busca)))
+        # O tokenizer trigram só indexa termos com 3+ caracteres; abaixo disso usa LIKE.
+        if min(len(termo) for termo in termos) >= 3 and busca_fts_disponivel():
+            termo_fts = " OR ".join('"' + termo.replace('"', '""') + '"' for termo in termos)
+            filtro = db.text("equipamento.id IN (SELECT rowid FROM equipamento_fts WHERE equipamento_fts MATCH :termo_fts)").bindparams(termo_fts=termo_fts)
+        else:
+            filtro = or_(*(
+                coluna.ilike(f"%{termo}%")
+                for termo in termos
+                for coluna in (Equipamento.serial, Equipamento.modelo, Equipamento.tipo)
+            ))
+        # Início de MAC (a partir do OUI): também por intervalo em mac_inteiro, o que encontra
+        # o prefixo pelo índice, sem depender do texto.
+        intervalo = intervalo_prefixo_mac(query_busca)
+        if intervalo:
+            filtro = or_(Equipamento.mac_inteiro.between(intervalo[0], intervalo[1] - 1), filtro)
+        base_query = base_query.filter(filtro)
     return base_query
 
 @app.route("/pesquisar")
@@ -332,7 +1451,7 @@ def get_filtered_equipamentos_query(base_query):
 def pesquisar():
     base_query = Equipamento.query
     query_com_filtros = get_filtered_equipamentos_query(base_query)
-    resultados = query_com_filtros.order_by(Equipamento.id.desc()).all()
+    resultados = paginar_keyset(query_com_filtros, Equipamento.id)
     if current_user.role == 'agendamento':
         return render_template("agendamento_index.html", equipamentos=resultados)
     return render_template(
@@ -344,11 +1463,27 @@ def pesquisar():
         filtro_mes=request.args.get("filtro_mes", ""),
     )
 
+def query_historico(equip_id: int):
+    """Testes do equipamento só com as colunas exibidas e o nome do tester (num único SELECT)."""
+    return (
+        db.session.query(
+            Teste.id, Teste.data_teste, Teste.status, Teste.velocidade_teste,
+            Teste.sinal_dbm, Teste.observacoes, User.username.label("tester_nome"),
+        )
+        .outerjoin(User, User.id == Teste.user_id)
+        .filter(Teste.equipamento_id == equip_id)
+    )
+
 @app.route("/historico/<int:equip_id>")
 @login_required
 def historico(equip_id: int):
     equipamento = Equipamento.query.get_or_404(equip_id)
-    return render_template("historico.html", equipamento=equipamento, historico=equipamento.testes)
+    return render_template(
+        "historico.html",
+        equipamento=equipamento,
+        historico=paginar_keyset(query_historico(equip_id), Teste.data_teste, Teste.id),
+        total_testes=equipamento.resumo.total_testes if equipamento.resumo else 0,
+    )
 
 @app.route("/delete/<int:id>", methods=["POST"])
 @login_required
@@ -356,9 +1491,21 @@ def delete(id: int):
     if current_user.role == 'agendamento': abort(403)
     equipamento = Equipamento.query.get_or_404(id)
     serial = equipamento.serial
-    db.session.delete(equipamento)
-    if safe_commit():
-        add_log("WARNING", f"Equipamento '{serial}' e todo o seu histórico foram apagados.")
+    contagens = {}
+    if equipamento.data_cadastro:
+        contagens[(equipamento.data_cadastro.date(), STATUS_CADASTRO, 0, equipamento.modelo)] = -1
+    for data_teste, status, user_id in db.session.query(Teste.data_teste, Teste.status, Teste.user_id).filter_by(equipamento_id=id):
+        if data_teste:
+            chave = (data_teste.date(), status, user_id, equipamento.modelo)
+            contagens[chave] = contagens.get(chave, 0) - 1
+
+    def gravar():
+        contabilizar(contagens)
+        registar_evento("apagado", status=None, status_anterior=equipamento.status_atual, **dados_equipamento(equipamento))
+        incrementar_versao("equipamentos")
+        db.session.delete(equipamento)
+    add_log("WARNING", f"Equipamento '{serial}' e todo o seu histórico foram apagados.")
+    if safe_commit(gravar):
         flash("Equipamento e histórico foram apagados.", "success")
     else:
         add_log("DANGER", f"Falha ao apagar equipamento '{serial}'.")
@@ -366,6 +1513,121 @@ def delete(id: int):
     return redirect(url_for("pesquisar"))
 
 
+# -------------------------
+# Painel de contagens
+# -------------------------
+def ler_dia(valor: Optional[str]) -> date:
+    """Converte 'AAAA-MM-DD' numa data; valores ausentes ou inválidos dão o dia de hoje."""
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return get_brasil_datetime().date()
+
+def carregar_contagens(dia: date) -> dict:
+    """Totais do dia por status, por tester e por modelo, lidos só de contagem_diaria."""
+    linhas = (
+        db.session.query(ContagemDiaria.status, ContagemDiaria.modelo, ContagemDiaria.total, User.username)
+        .outerjoin(User, User.id == ContagemDiaria.user_id)
+        .filter(ContagemDiaria.dia == dia, ContagemDiaria.total > 0)
+        .all()
+    )
+    por_status, por_tester, por_modelo, cadastrados = {}, {}, {}, 0
+    for status, modelo, total, username in linhas:
+        if status == STATUS_CADASTRO:
+            cadastrados += total
+            continue
+        por_status[status] = por_status.get(status, 0) + total
+        for grupos, nome in ((por_tester, username or "(removido)"), (por_modelo, modelo)):
+            grupo = grupos.setdefault(nome, {"status": {}, "total": 0})
+            grupo["status"][status] = grupo["status"].get(status, 0) + total
+            grupo["total"] += total
+    return {
+        "dia": dia.isoformat(),
+        "cadastrados": cadastrados,
+        "testados": sum(por_status.values()),
+        "por_status": por_status,
+        "por_tester": [dict(username=nome, **grupo) for nome, grupo in sorted(por_tester.items())],
+        "por_modelo": [dict(modelo=nome, **grupo) for nome, grupo in sorted(por_modelo.items())],
+    }
+
+@app.route("/stats")
+@login_required
+def stats():
+    dia = ler_dia(request.args.get("dia"))
+    return render_template(
+        "stats.html",
+        contagens=carregar_contagens(dia),
+        status_colunas=STATUS_TESTE,
+        dia_anterior=(dia - timedelta(days=1)).isoformat(),
+        dia_seguinte=(dia + timedelta(days=1)).isoformat(),
+    )
+
+@app.route("/api/stats")
+def api_stats():
+    """Mesmos dados de /stats em JSON (sessão ou token de API); `?dia=AAAA-MM-DD`."""
+    if not current_user.is_authenticated:
+        return jsonify(erro="Token de API ausente ou inválido."), 401
+    return jsonify(carregar_contagens(ler_dia(request.args.get("dia"))))
+
+
+# -------------------------
+# Atualizações ao vivo (SSE)
+# -------------------------
+def formatar_evento_sse(evento: dict) -> str:
+    return f"id: {evento['id']}\nevent: equipamento\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+@app.route("/eventos")
+@login_required
+def eventos():
+    """Server-Sent Events com as alterações de equipamentos, para as tabelas do index e do agendamento.
+
+    Quem reconecta envia Last-Event-ID e recebe o que perdeu (até EVENTOS_REPLAY_MAX;
+    acima disso, um evento "recarregar"). A ligação fecha ao fim de EVENTOS_DURACAO_MAX
+    segundos para não prender uma thread do worker indefinidamente.
+    """
+    if len(canal_eventos) >= app.config["EVENTOS_MAX_CLIENTES"]:
+        return Response("retry: 30000\n\n", status=503, mimetype="text/event-stream")
+    # Inscreve antes do replay: um evento publicado entre os dois chega pela fila e é ignorado por id
+    inscricao = canal_eventos.inscrever()
+    replay = []
+    ultimo = request.headers.get("Last-Event-ID", "")
+    if ultimo.isdigit():
+        try:
+            replay = carregar_eventos_desde(int(ultimo), EVENTOS_REPLAY_MAX + 1)
+        except Exception:
+            canal_eventos.cancelar(inscricao)
+            raise
+        if len(replay) > EVENTOS_REPLAY_MAX:
+            replay = replay[:EVENTOS_REPLAY_MAX] + [{"id": replay[EVENTOS_REPLAY_MAX - 1]["id"], "acao": "recarregar"}]
+    heartbeat = app.config["EVENTOS_HEARTBEAT"]
+    fim = time.monotonic() + app.config["EVENTOS_DURACAO_MAX"]
+
+    def gerar():
+        # Não usa o banco nem o contexto do request: o contexto já foi fechado quando isto corre
+        try:
+            yield "retry: 5000\n\n"
+            enviado = 0
+            for evento in replay:
+                enviado = max(enviado, evento["id"])
+                yield formatar_evento_sse(evento)
+            while inscricao.ativa and time.monotonic() < fim:
+                try:
+                    evento = inscricao.fila.get(timeout=min(heartbeat, max(0.1, fim - time.monotonic())))
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if evento["id"] > enviado:
+                    enviado = evento["id"]
+                    yield formatar_evento_sse(evento)
+        finally:
+            canal_eventos.cancelar(inscricao)
+
+    response = Response(gerar(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # nginx não deve acumular o stream
+    return response
+
+
 # -------------------------
 # Administração
 # -------------------------
@@ -391,9 +1653,12 @@ def add_user():
         return redirect(url_for("manage_users"))
     novo = User(username=username, role=role)
     novo.set_password(password)
-    db.session.add(novo)
-    if safe_commit():
-        add_log("SUCCESS", f"Novo utilizador '{username}' (role: {role}) foi criado.")
+
+    def gravar():
+        db.session.add(novo)
+        invalidar_cache_usuarios()
+    add_log("SUCCESS", f"Novo utilizador '{username}' (role: {role}) foi criado.")
+    if safe_commit(gravar):
         flash(f'Utilizador "{username}" criado com sucesso.', "success")
     else:
         add_log("DANGER", f"Falha ao criar utilizador '{username}'.")
@@ -409,9 +1674,12 @@ def delete_user(user_id: int):
     if user_to_delete.role == 'master':
         flash("Não é possível apagar o utilizador master.", "danger")
         return redirect(url_for("manage_users"))
-    db.session.delete(user_to_delete)
-    if safe_commit():
-        add_log("WARNING", f"Utilizador '{username}' foi apagado.")
+
+    def gravar():
+        invalidar_cache_usuarios()
+        db.session.delete(user_to_delete)
+    add_log("WARNING", f"Utilizador '{username}' foi apagado.")
+    if safe_commit(gravar):
         flash("Utilizador apagado com sucesso.", "success")
     else:
         add_log("DANGER", f"Falha ao apagar utilizador '{username}'.")
@@ -431,9 +1699,12 @@ def reset_user_password(user_id: int):
     if not new_password:
         flash('A nova senha não pode estar em branco.', 'danger')
         return redirect(url_for('manage_users'))
-    user_to_reset.set_password(new_password)
-    if safe_commit():
-        add_log("WARNING", f"Senha do utilizador '{username}' foi resetada.")
+
+    def gravar():
+        user_to_reset.set_password(new_password)
+        invalidar_cache_usuarios()
+    add_log("WARNING", f"Senha do utilizador '{username}' foi resetada.")
+    if safe_commit(gravar):
         flash(f'Senha do utilizador "{username}" foi resetada com sucesso.', 'success')
     else:
         add_log("DANGER", f"Falha ao resetar senha do utilizador '{username}'.")
@@ -444,32 +1715,209 @@ def reset_user_password(user_id: int):
 @login_required
 @admin_required
 def view_logs():
-    page = request.args.get('page', 1, type=int)
-    logs = Log.query.order_by(Log.timestamp.desc()).paginate(page=page, per_page=50)
-    return render_template('admin_logs.html', logs=logs)
+    filtro_level = request.args.get('level', '').strip()
+    filtro_user = request.args.get('user_id', type=int)
+    query = Log.query.options(db.joinedload(Log.user))
+    if filtro_level:
+        query = query.filter(Log.level == filtro_level)
+    if filtro_user:
+        query = query.filter(Log.user_id == filtro_user)
+    logs = paginar_keyset(query, Log.timestamp, Log.id)
+    return render_template(
+        'admin_logs.html',
+        logs=logs,
+        users=User.query.order_by(User.username).all(),
+        filtro_level=filtro_level,
+        filtro_user=filtro_user,
+    )
+
+@app.route('/admin/metrics')
+@login_required
+@admin_required
+def view_metrics():
+    return render_template(
+        'admin_metrics.html',
+        ativas=app.config["METRICAS_ATIVAS"],
+        limite_lento_ms=app.config["METRICAS_LIMITE_LENTO_MS"],
+        resumo=metricas_requests.resumo(),
+        lentos=metricas_requests.lentos(),
+        pid=os.getpid(),
+    )
+
+@app.route('/admin/metrics/limpar', methods=['POST'])
+@login_required
+@admin_required
+def limpar_metrics():
+    metricas_requests.limpar()
+    flash("Métricas deste processo foram limpas.", "info")
+    return redirect(url_for('view_metrics'))
 
 
 # -------------------------
 # Exportar PDF
 # -------------------------
+def responder_pdf(template: str, nome_arquivo: str, partes_chave: tuple, carregar):
+    """Responde com o PDF do relatório, usando o cache sempre que possível.
+
+    `partes_chave` identifica o relatório e a versão dos dados (vira o ETag);
+    `carregar()` só é chamado em cache miss e devolve (total_linhas, contexto).
+    Relatórios pequenos são gerados no request; os grandes vão para a fila.
+    """
+    chave = gerar_chave(template, *partes_chave)
+    if chave in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        caminho = cache_pdf.obter(chave)
+        if caminho:
+            response = send_file(caminho, mimetype="application/pdf", download_name=nome_arquivo, etag=False)
+        else:
+            total_linhas, contexto = carregar()
+            html = render_template(template, now=get_brasil_datetime(), logo_base64=get_logo_base64(), **contexto)
+            if total_linhas > app.config["PDF_LIMITE_INLINE"]:
+                try:
+                    job_id = fila_pdf.submeter(html, nome_arquivo, current_user.id, chave_cache=chave)
+                except FilaCheiaError:
+                    flash("Há muitas exportações em andamento. Tente novamente em instantes.", "danger")
+                    return redirect(request.referrer or url_for("pesquisar"))
+                return redirect(url_for("export_job_status", job_id=job_id))
+            inicio = time.perf_counter()
+            pdf = pdf_render.renderizar(html); medir_tempo("pdf_ms", inicio); cache_pdf.guardar(chave, pdf)
+            response = make_response(pdf); response.headers["Content-Type"] = "application/pdf"
+        response.headers["Content-Disposition"] = f'inline; filename={nome_arquivo}'
+    response.set_etag(chave)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def get_job_autorizado(job_id: str) -> dict:
+    """Devolve o job se existir e pertencer ao utilizador atual (ou se este for admin)."""
+    job = fila_pdf.status(job_id)
+    if job is None or (job["user_id"] != current_user.id and not current_user.is_admin):
+        abort(404)
+    return job
+
 @app.route("/export/pesquisa/pdf")
 @login_required
 def export_pesquisa_pdf():
-    base_query = Equipamento.query; query_com_filtros = get_filtered_equipamentos_query(base_query); resultados = query_com_filtros.order_by(Equipamento.id.desc()).all()
-    logo_b64 = get_logo_base64()
-    html = render_template("relatorio_pesquisa_pdf.html", equipamentos=resultados, now=get_brasil_datetime(), logo_base64=logo_b64)
-    pdf = HTML(string=html).write_pdf(); response = make_response(pdf)
-    response.headers["Content-Type"] = "application/pdf"; response.headers["Content-Disposition"] = f'inline; filename=relatorio_pesquisa_{date.today()}.pdf'
-    return response
+    filtros = {k: request.args.get(k, "").strip() for k in ("q", "filtro_status", "filtro_dia", "filtro_mes")}
+    versao = (obter_versao("equipamentos"), db.session.query(db.func.max(Teste.id)).scalar())
+
+    def carregar():
+        base_query = Equipamento.query; query_com_filtros = get_filtered_equipamentos_query(base_query); resultados = query_com_filtros.order_by(Equipamento.id.desc()).all()
+        return len(resultados), {"equipamentos": resultados}
+
+    return responder_pdf("relatorio_pesquisa_pdf.html", f"relatorio_pesquisa_{date.today()}.pdf", (filtros, versao), carregar)
 
 @app.route("/historico/<int:equip_id>/export/pdf")
 @login_required
 def export_historico_pdf(equip_id: int):
     equipamento = Equipamento.query.get_or_404(equip_id)
-    logo_b64 = get_logo_base64()
-    html = render_template("relatorio_historico_pdf.html", equipamento=equipamento, historico=equipamento.testes, now=get_brasil_datetime(), logo_base64=logo_b64)
-    pdf = HTML(string=html).write_pdf(); response = make_response(pdf)
-    response.headers["Content-Type"] = "application/pdf"; response.headers["Content-Disposition"] = f'inline; filename=historico_{equipamento.serial}.pdf'
+    ultimo_teste_id, total_testes = db.session.query(db.func.max(Teste.id), db.func.count(Teste.id)).filter(Teste.equipamento_id == equip_id).one()
+    versao = (equipamento.serial, equipamento.status_atual, equipamento.data_cadastro, ultimo_teste_id, total_testes)
+
+    def carregar():
+        # Lido em lotes durante a renderização do template, sem materializar o histórico todo
+        historico = query_historico(equip_id).order_by(Teste.data_teste.desc(), Teste.id.desc()).yield_per(EXPORT_LOTE)
+        return total_testes, {"equipamento": equipamento, "historico": historico}
+
+    return responder_pdf("relatorio_historico_pdf.html", f"historico_{equipamento.serial}.pdf", (equip_id, versao), carregar)
+
+@app.route("/export/jobs/<job_id>")
+@login_required
+def export_job_status(job_id: str):
+    job = get_job_autorizado(job_id)
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(
+            status=job["status"],
+            download_url=url_for("export_job_download", job_id=job_id) if job["status"] == "concluido" else None,
+        )
+    if job["status"] == "concluido":
+        return redirect(url_for("export_job_download", job_id=job_id))
+    return render_template("export_status.html", job=job)
+
+@app.route("/export/jobs/<job_id>/download")
+@login_required
+def export_job_download(job_id: str):
+    job = get_job_autorizado(job_id)
+    if job["status"] != "concluido":
+        return redirect(url_for("export_job_status", job_id=job_id))
+    caminho = fila_pdf.caminho_pdf(job_id)
+    if job.get("chave_cache") and not cache_pdf.obter(job["chave_cache"]):
+        cache_pdf.guardar_arquivo(job["chave_cache"], caminho)
+    response = send_file(caminho, mimetype="application/pdf", download_name=job["nome_arquivo"], etag=job.get("chave_cache") or True)
+    response.headers["Content-Disposition"] = f'inline; filename={job["nome_arquivo"]}'
+    return response
+
+
+# -------------------------
+# Exportar CSV / NDJSON (streaming)
+# -------------------------
+EXPORT_LOTE = 1000  # linhas lidas do banco por lote (yield_per) e por bloco enviado
+
+def query_export_pesquisa(por_teste: bool):
+    """Query de colunas (sem entidades ORM) com os filtros da pesquisa, para exportação."""
+    if not por_teste:
+        query = db.session.query(
+            Equipamento.id, Equipamento.serial, Equipamento.tipo, Equipamento.modelo,
+            Equipamento.status_atual, Equipamento.data_cadastro,
+            EquipamentoResumo.total_testes, EquipamentoResumo.ultimo_teste_data, EquipamentoResumo.ultimo_tester_nome,
+        ).outerjoin(EquipamentoResumo, EquipamentoResumo.equipamento_id == Equipamento.id)
+        return get_filtered_equipamentos_query(query).order_by(Equipamento.id.desc())
+    ids_filtrados = get_filtered_equipamentos_query(db.session.query(Equipamento.id))
+    return (
+        db.session.query(
+            Equipamento.serial, Equipamento.tipo, Equipamento.modelo, Equipamento.status_atual,
+            Teste.id.label("teste_id"), Teste.data_teste, Teste.status, Teste.velocidade_teste,
+            Teste.sinal_dbm, Teste.observacoes, User.username.label("testado_por"),
+        )
+        .join(Teste, Teste.equipamento_id == Equipamento.id)
+        .outerjoin(User, User.id == Teste.user_id)
+        .filter(Equipamento.id.in_(ids_filtrados.subquery().select()))
+        .order_by(Equipamento.id.desc(), Teste.data_teste.desc())
+    )
+
+def _valor_export(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+@app.route("/export/pesquisa.<any(csv, ndjson):formato>")
+@login_required
+def export_pesquisa_stream(formato: str):
+    """Exporta o resultado da pesquisa em CSV ou NDJSON, em streaming e com memória constante.
+
+    Com `?testes=1` gera uma linha por Teste (com o nome do testador) em vez de uma por equipamento.
+    """
+    por_teste = request.args.get("testes", "") in ("1", "true", "sim")
+    query = query_export_pesquisa(por_teste).execution_options(yield_per=EXPORT_LOTE)
+    colunas = [c["name"] for c in query.column_descriptions]
+
+    def gerar_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write("\ufeff")  # BOM para o Excel reconhecer UTF-8
+        writer.writerow(colunas)
+        for i, linha in enumerate(query, 1):
+            writer.writerow([_valor_export(v) for v in linha])
+            if i % EXPORT_LOTE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0); buffer.truncate()
+        yield buffer.getvalue()
+
+    def gerar_ndjson():
+        bloco = []
+        for linha in query:
+            bloco.append(json.dumps(dict(zip(colunas, map(_valor_export, linha))), ensure_ascii=False))
+            if len(bloco) >= EXPORT_LOTE:
+                yield "\n".join(bloco) + "\n"
+                bloco = []
+        if bloco:
+            yield "\n".join(bloco) + "\n"
+
+    sufixo = "_testes" if por_teste else ""
+    if formato == "csv":
+        response = Response(stream_with_context(gerar_csv()), mimetype="text/csv")
+    else:
+        response = Response(stream_with_context(gerar_ndjson()), mimetype="application/x-ndjson")
+    response.headers["Content-Disposition"] = f"attachment; filename=pesquisa{sufixo}_{date.today()}.{formato}"
     return response
 
 
@@ -479,6 +1927,523 @@ def export_historico_pdf(equip_id: int):
 @app.cli.command("init-db")
 def init_db_command(): db.create_all(); print("✅ Banco de dados inicializado com sucesso.")
 
+def preparar_banco() -> None:
+    """Cria as tabelas em falta e completa as migrações de bancos antigos (requer app context).
+
+    Chamado no arranque pelo main.py e pelo gunicorn (on_starting), antes de aceitar pedidos.
+    Cada passo só corre quando é preciso, por isso o arranque de um banco atualizado é rápido.
+    """
+    def executar(comando):
+        with click.Context(comando) as contexto:
+            contexto.invoke(comando)
+
+    db.create_all()
+    # Bancos anteriores a mac_inteiro, com a migração interrompida (o índice é o último passo do
+    # flask migrate-mac, que pode ser repetido sem efeitos) ou copiados de uma versão antiga
+    if (
+        "ix_equipamento_mac_inteiro" not in {ix["name"] for ix in db.inspect(db.engine).get_indexes("equipamento")}
+        or seriais_por_normalizar()
+    ):
+        executar(migrate_mac_command)
+    # Bancos anteriores ao equipamento_resumo: create_all cria a tabela vazia
+    if db.session.query(Teste.id).first() and not db.session.query(EquipamentoResumo.equipamento_id).first():
+        executar(rebuild_resumo_command)
+    # Bancos anteriores a contagem_diaria: sem o histórico, /stats fica a zero e os apagamentos
+    # descontariam dias nunca contados (totais negativos)
+    tem_historico = (
+        db.session.query(Teste.id).first()
+        or db.session.query(Equipamento.id).filter(Equipamento.data_cadastro.isnot(None)).first()
+    )
+    if tem_historico and not db.session.query(ContagemDiaria.dia).first():
+        executar(rebuild_contagens_command)
+
+@app.cli.command("migrate-indices")
+def migrate_indices_command():
+    """Cria em bancos existentes os índices declarados nos models que ainda não existem."""
+    criados = 0
+    with db.engine.begin() as conn:
+        inspector = db.inspect(conn)
+        # Tabelas que ainda não existem são criadas com todos os índices por create_all/init-db
+        existentes = {
+            tabela.name: {ix["name"] for ix in inspector.get_indexes(tabela.name)}
+            for tabela in db.metadata.sorted_tables
+            if inspector.has_table(tabela.name)
+        }
+        for tabela in db.metadata.sorted_tables:
+            if tabela.name not in existentes:
+                print(f"⚠️ Tabela {tabela.name} não existe; será criada com os índices por 'flask init-db'.")
+                continue
+            colunas = {coluna["name"] for coluna in inspector.get_columns(tabela.name)}
+            for indice in tabela.indexes:
+                if any(coluna.name not in colunas for coluna in indice.columns):
+                    print(f"⚠️ {indice.name}: coluna em falta em {tabela.name}; corra 'flask migrate-mac'.")
+                    continue
+                if indice.name not in existentes[tabela.name]:
+                    indice.create(bind=conn)
+                    print(f"➕ Índice criado: {indice.name}")
+                    criados += 1
+    print(f"✅ {criados} índice(s) criado(s).")
+
+def seriais_por_normalizar() -> bool:
+    """Indica se há equipamentos sem mac_inteiro com o serial fora da forma canónica ou com forma de MAC.
+
+    Acontece em bancos anteriores à normalização, mesmo que a coluna e o índice já existam
+    (ex.: criados por create_all num `flask copy-db` a partir de um testes.db antigo).
+    """
+    sem_separadores = Equipamento.serial
+    for separador in (":", "-", ".", " "):
+        sem_separadores = db.func.replace(sem_separadores, separador, "")
+    candidatos = db.session.query(Equipamento.serial).filter(
+        Equipamento.mac_inteiro.is_(None),
+        or_(Equipamento.serial != db.func.upper(Equipamento.serial), db.func.length(sem_separadores) == 12),
+    )
+    return any(
+        normalizar_serial(serial)[0] != serial or mac_para_inteiro(serial) is not None
+        for (serial,) in candidatos.yield_per(EXPORT_LOTE)
+    )
+
+@app.cli.command("migrate-mac")
+def migrate_mac_command():
+    """Normaliza os seriais, preenche mac_inteiro e funde equipamentos duplicados (ex.: aabbcc... e AA:BB:CC...).
+
+    Em cada grupo de duplicados fica o equipamento mais antigo, que recebe o histórico
+    de testes dos outros; se algum estava a aguardar teste, o equipamento fundido também fica.
+    O índice ix_equipamento_mac_inteiro só é criado no fim: enquanto faltar, a migração não
+    terminou e pode ser repetida (main.py volta a corrê-la no arranque).
+    """
+    db.create_all()
+    with db.engine.begin() as conn:
+        colunas = {coluna["name"] for coluna in db.inspect(conn).get_columns("equipamento")}
+        if "mac_inteiro" not in colunas:
+            conn.execute(db.text("ALTER TABLE equipamento ADD COLUMN mac_inteiro BIGINT"))
+            print("➕ Coluna criada: equipamento.mac_inteiro")
+
+    grupos = {}
+    linhas = db.session.query(
+        Equipamento.id, Equipamento.serial, Equipamento.mac_inteiro, Equipamento.status_atual, Equipamento.data_cadastro
+    ).order_by(Equipamento.id)
+    for linha in linhas.yield_per(EXPORT_LOTE):
+        serial, mac = normalizar_serial(linha.serial)
+        grupos.setdefault(serial, []).append((linha, mac))
+
+    atualizacoes, fundidos = [], 0
+    for serial, membros in grupos.items():
+        (principal, mac), duplicados = membros[0], [linha for linha, _ in membros[1:]]
+        valores = {"id": principal.id, "serial": serial, "mac_inteiro": mac}
+        if duplicados:
+            ids = [linha.id for linha in duplicados]
+            db.session.execute(db.update(Teste).where(Teste.equipamento_id.in_(ids)).values(equipamento_id=principal.id))
+            db.session.execute(db.delete(EquipamentoResumo).where(EquipamentoResumo.equipamento_id.in_(ids)))
+            db.session.execute(db.delete(Equipamento).where(Equipamento.id.in_(ids)))
+            ultimo_status = (
+                db.session.query(Teste.status).filter_by(equipamento_id=principal.id)
+                .order_by(Teste.data_teste.desc(), Teste.id.desc()).limit(1).scalar()
+            )
+            aguardando = any(linha.status_atual == "Aguardando Teste" for linha, _ in membros)
+            valores["status_atual"] = "Aguardando Teste" if aguardando or ultimo_status is None else ultimo_status
+            valores["data_cadastro"] = min((linha.data_cadastro for linha, _ in membros if linha.data_cadastro), default=None)
+            print(f"🔀 {serial}: {', '.join(linha.serial for linha, _ in membros)} → equipamento {principal.id}")
+            fundidos += len(duplicados)
+        if duplicados or serial != principal.serial or mac != principal.mac_inteiro:
+            atualizacoes.append(valores)
+    # Os duplicados já foram apagados: os seriais canónicos não colidem com nenhuma linha restante
+    for parte in em_partes(atualizacoes):
+        db.session.execute(db.update(Equipamento), parte)
+    if atualizacoes:
+        incrementar_versao("equipamentos")
+    if fundidos:
+        registar_evento("recarregar")
+    if not safe_commit():
+        print("❌ Erro ao normalizar os seriais; nenhuma alteração foi gravada.")
+        return
+
+    indice = next(ix for ix in Equipamento.__table__.indexes if ix.name == "ix_equipamento_mac_inteiro")
+    with db.engine.begin() as conn:
+        if indice.name not in {ix["name"] for ix in db.inspect(conn).get_indexes("equipamento")}:
+            indice.create(bind=conn)
+            print(f"➕ Índice criado: {indice.name}")
+    print(f"✅ {len(atualizacoes)} equipamento(s) normalizado(s), {fundidos} duplicado(s) fundido(s).")
+    if fundidos:
+        contexto = click.get_current_context()
+        contexto.invoke(rebuild_resumo_command)
+        contexto.invoke(rebuild_contagens_command)
+
+@app.cli.command("rebuild-resumo")
+def rebuild_resumo_command():
+    """Reconstrói a tabela equipamento_resumo a partir do histórico de testes."""
+    db.create_all()
+    ranked = db.session.query(
+        Teste.id, Teste.equipamento_id, Teste.data_teste, Teste.user_id,
+        Teste.velocidade_teste, Teste.sinal_dbm, Teste.observacoes,
+        db.func.row_number().over(
+            partition_by=Teste.equipamento_id,
+            order_by=(Teste.data_teste.desc(), Teste.id.desc()),
+        ).label("rn"),
+        db.func.count().over(partition_by=Teste.equipamento_id).label("total"),
+    ).subquery()
+    linhas = (
+        db.session.query(ranked, User.username)
+        .outerjoin(User, User.id == ranked.c.user_id)
+        .filter(ranked.c.rn == 1)
+        .all()
+    )
+    db.session.execute(db.delete(EquipamentoResumo))
+    if linhas:
+        db.session.execute(db.insert(EquipamentoResumo), [
+            {
+                "equipamento_id": l.equipamento_id,
+                "ultimo_teste_id": l.id,
+                "ultimo_teste_data": l.data_teste,
+                "ultimo_tester_nome": l.username,
+                "ultima_velocidade": l.velocidade_teste,
+                "ultimo_sinal_dbm": l.sinal_dbm,
+                "ultimas_observacoes": l.observacoes,
+                "total_testes": l.total,
+            }
+            for l in linhas
+        ])
+    incrementar_versao("equipamentos")
+    if safe_commit(): print(f"✅ Resumo reconstruído para {len(linhas)} equipamentos.")
+    else: print("❌ Erro ao reconstruir o resumo dos equipamentos.")
+
+@app.cli.command("rebuild-contagens")
+def rebuild_contagens_command():
+    """Reconstrói a tabela contagem_diaria a partir dos equipamentos e do histórico de testes."""
+    db.create_all()
+    contagens = {}
+    # Agregado em Python: date() não é portável entre SQLite e PostgreSQL
+    cadastros = db.session.query(Equipamento.data_cadastro, Equipamento.modelo).filter(Equipamento.data_cadastro.isnot(None))
+    for data_cadastro, modelo in cadastros.yield_per(EXPORT_LOTE):
+        chave = (data_cadastro.date(), STATUS_CADASTRO, 0, modelo)
+        contagens[chave] = contagens.get(chave, 0) + 1
+    testes = (
+        db.session.query(Teste.data_teste, Teste.status, Teste.user_id, Equipamento.modelo)
+        .join(Equipamento, Equipamento.id == Teste.equipamento_id)
+        .filter(Teste.data_teste.isnot(None))
+    )
+    for data_teste, status, user_id, modelo in testes.yield_per(EXPORT_LOTE):
+        chave = (data_teste.date(), status, user_id, modelo)
+        contagens[chave] = contagens.get(chave, 0) + 1
+    db.session.execute(db.delete(ContagemDiaria))
+    if contagens:
+        db.session.execute(db.insert(ContagemDiaria), [
+            {"dia": dia, "status": status, "user_id": user_id, "modelo": modelo, "total": total}
+            for (dia, status, user_id, modelo), total in contagens.items()
+        ])
+    if safe_commit(): print(f"✅ Contagens reconstruídas ({len(contagens)} linha(s)).")
+    else: print("❌ Erro ao reconstruir as contagens.")
+
+@app.cli.command("rebuild-busca")
+def rebuild_busca_command():
+    """Cria (se preciso) e reconstrói o índice FTS5 de busca de equipamentos."""
+    global _busca_fts_disponivel
+    if db.engine.dialect.name != "sqlite":
+        print("ℹ️ O índice de busca FTS5 só está disponível em SQLite; a busca usará LIKE.")
+        return
+    for ddl in BUSCA_FTS_DDL:
+        db.session.execute(db.text(ddl))
+    db.session.execute(db.text("INSERT INTO equipamento_fts(equipamento_fts) VALUES ('rebuild')"))
+    if safe_commit():
+        _busca_fts_disponivel = True
+        print("✅ Índice de busca reconstruído.")
+    else: print("❌ Erro ao reconstruir o índice de busca.")
+
+@app.cli.command("archive-logs")
+@click.option("--dias", type=int, default=lambda: int(os.environ.get("LOG_RETENCAO_DIAS", 180)), show_default="LOG_RETENCAO_DIAS ou 180", help="Mantém no banco apenas os logs dos últimos N dias.")
+@click.option("--destino", default=lambda: os.environ.get("LOG_ARQUIVO_DIR", os.path.join(base_dir, "arquivo_logs")), help="Diretório dos ficheiros de arquivo.")
+def archive_logs_command(dias: int, destino: str):
+    """Move os logs mais antigos que N dias para ficheiros gzip NDJSON mensais e apaga-os do banco."""
+    limite = (get_brasil_datetime() - timedelta(days=dias)).replace(tzinfo=None)
+    os.makedirs(destino, exist_ok=True)
+    query = (
+        db.session.query(Log.id, Log.timestamp, Log.level, Log.message, Log.user_id, User.username)
+        .outerjoin(User, User.id == Log.user_id)
+        .filter(Log.timestamp < limite)
+        .order_by(Log.timestamp, Log.id)
+    )
+    total = 0
+    while True:
+        # Cada lote é escrito no arquivo e só depois apagado do banco; uma interrupção
+        # a meio pode, no pior caso, repetir linhas no arquivo, mas nunca perdê-las.
+        lote = query.limit(EXPORT_LOTE).all()
+        if not lote:
+            break
+        por_mes = {}
+        for linha in lote:
+            por_mes.setdefault(linha.timestamp.strftime("%Y-%m"), []).append(
+                json.dumps({k: _valor_export(v) for k, v in linha._asdict().items()}, ensure_ascii=False)
+            )
+        for mes, linhas in por_mes.items():
+            # Cada append cria um novo membro gzip; gzip.open lê o ficheiro inteiro normalmente.
+            with gzip.open(os.path.join(destino, f"logs_{mes}.ndjson.gz"), "at", encoding="utf-8") as f:
+                f.write("\n".join(linhas) + "\n")
+        db.session.execute(db.delete(Log).where(Log.id.in_([linha.id for linha in lote])))
+        if not safe_commit():
+            print("❌ Erro ao apagar logs arquivados; o arquivo pode conter linhas repetidas numa nova execução.")
+            return
+        total += len(lote)
+    print(f"✅ {total} log(s) anteriores a {limite:%d/%m/%Y} arquivado(s) em {destino}.")
+
+@app.cli.command("clean-eventos")
+@click.option("--horas", type=int, default=24, show_default=True, help="Mantém apenas os eventos das últimas N horas.")
+def clean_eventos_command(horas: int):
+    """Apaga os eventos de alteração mais antigos que N horas (usados só para reconexões SSE)."""
+    limite = (get_brasil_datetime() - timedelta(hours=horas)).replace(tzinfo=None)
+    apagados = db.session.execute(db.delete(EventoAlteracao).where(EventoAlteracao.criado_em < limite)).rowcount
+    if safe_commit():
+        print(f"✅ {apagados} evento(s) anteriores a {limite:%d/%m/%Y %H:%M} apagado(s).")
+    else:
+        print("❌ Erro ao apagar eventos antigos.")
+
+@app.cli.command("comprimir-assets")
+@click.option("--minimo", type=int, default=lambda: app.config["COMPRESSAO_MINIMO"], show_default="COMPRESSAO_MINIMO ou 1024", help="Ignora ficheiros menores que N bytes.")
+def comprimir_assets_command(minimo: int):
+    """Grava as versões .gz/.br dos estáticos de texto (passo de build; servidas por /assets)."""
+    contagem = precomprimir(app.static_folder, minimo)
+    print(
+        f"✅ {contagem['gravados']} ficheiro(s) comprimido(s), {contagem['atuais']} já atualizado(s), "
+        f"{contagem['removidos']} órfão(s) removido(s) em {app.static_folder}."
+    )
+    if "br" not in codificacoes_disponiveis():
+        print("⚠️ Pacote 'brotli' não instalado: só foram geradas versões .gz.")
+
+@app.cli.command("clean-spool")
+def clean_spool_command():
+    """Apaga do spool de exportação os PDFs mais antigos que PDF_SPOOL_TTL."""
+    print(f"✅ {fila_pdf.limpar_expirados()} ficheiro(s) expirado(s) apagado(s).")
+
+@app.cli.command("create-api-token")
+@click.argument("username")
+@click.option("--descricao", default="", help="Identificação da bancada/rig que usará o token.")
+def create_api_token_command(username: str, descricao: str):
+    """Cria um token de API para USERNAME (mostrado apenas uma vez)."""
+    user = User.query.filter_by(username=username).first()
+    if not user: print(f"❌ Utilizador '{username}' não encontrado."); return
+    token = secrets.token_urlsafe(32)
+    db.session.add(ApiToken(token_hash=ApiToken.gerar_hash(token), descricao=descricao or None, user_id=user.id))
+    if safe_commit(): print(f"✅ Token criado para '{username}'. Guarde-o agora, ele não será mostrado novamente:\n{token}")
+    else: print("❌ Erro ao criar o token de API.")
+
+@app.cli.command("copy-db")
+@click.option("--origem", default=db_path, show_default=True, help="Ficheiro SQLite de origem.")
+@click.option("--lote", default=EXPORT_LOTE, show_default=True, help="Linhas por INSERT em lote.")
+def copy_db_command(origem: str, lote: int):
+    """Copia um testes.db existente para o banco configurado em DATABASE_URL."""
+    origem_uri = f"sqlite:///{os.path.abspath(origem)}"
+    if not os.path.exists(origem):
+        print(f"❌ Ficheiro de origem não encontrado: {origem}"); return
+    if origem_uri == app.config["SQLALCHEMY_DATABASE_URI"]:
+        print("❌ A origem é o próprio banco configurado; defina DATABASE_URL para o destino."); return
+    db.create_all()
+    for tabela in db.metadata.sorted_tables:
+        if db.session.execute(db.select(db.func.count()).select_from(tabela)).scalar():
+            print(f"❌ A tabela '{tabela.name}' do destino não está vazia; abortando."); return
+
+    engine_origem = create_engine(origem_uri)
+    tabelas_origem = set(db.inspect(engine_origem).get_table_names())
+    with engine_origem.connect() as conn_origem, db.engine.begin() as conn_destino:
+        # sorted_tables respeita as FKs (user antes de teste, etc.)
+        for tabela in db.metadata.sorted_tables:
+            if tabela.name not in tabelas_origem:
+                continue
+            colunas_origem = {c["name"] for c in db.inspect(engine_origem).get_columns(tabela.name)}
+            colunas = [c for c in tabela.columns if c.name in colunas_origem]
+            resultado = conn_origem.execution_options(yield_per=lote).execute(db.select(*colunas))
+            total = 0
+            for linhas in resultado.partitions():
+                conn_destino.execute(tabela.insert(), [dict(linha._mapping) for linha in linhas])
+                total += len(linhas)
+            print(f"➕ {tabela.name}: {total} linha(s)")
+        if conn_destino.dialect.name == "postgresql":
+            # Os ids foram copiados explicitamente; alinha as sequences com o maior id.
+            for tabela in db.metadata.sorted_tables:
+                pk = list(tabela.primary_key.columns)
+                if len(pk) == 1 and pk[0].autoincrement is not False and isinstance(pk[0].type, db.Integer):
+                    conn_destino.execute(db.text(
+                        f"SELECT setval(pg_get_serial_sequence('\"{tabela.name}\"', '{pk[0].name}'), "
+                        f"COALESCE((SELECT MAX({pk[0].name}) FROM \"{tabela.name}\"), 1))"
+                    ))
+    engine_origem.dispose()
+    # Origem anterior à normalização dos seriais: as linhas vêm sem mac_inteiro e com os seriais
+    # como foram digitados, o que faria falhar a deteção de duplicados no destino
+    if seriais_por_normalizar():
+        click.get_current_context().invoke(migrate_mac_command)
+    print("✅ Cópia concluída.")
+
+# Dados sintéticos: OUIs de fabricantes de ONT/roteadores e modelos comuns na bancada
+GERADOR_OUIS = ("00:E0:FC", "48:F8:DB", "E0:67:B3", "C8:3A:35", "D8:07:B6", "F4:6B:EF")
+GERADOR_MODELOS = (
+    ("ONU", "AN5506-01-A"), ("ONU", "AN5506-04-FA"), ("ONT", "HG8245H"),
+    ("ONT", "EG8145V5"), ("ROTEADOR", "W5-1200F"), ("ROTEADOR", "Archer C6"),
+)
+GERADOR_OBSERVACOES = ("Porta LAN 2 sem link.", "Sinal no limite.", "Reset de fábrica aplicado.", "Wi-Fi 5G instável.")
+
+@app.cli.command("gerar-dados")
+@click.option("--destino", default=os.path.join(base_dir, "bench.db"), show_default=True, help="Ficheiro SQLite a criar.")
+@click.option("--equipamentos", default=10000, show_default=True, help="Número de equipamentos (N).")
+@click.option("--testes", default=3, show_default=True, help="Testes por equipamento (M).")
+@click.option("--usuarios", default=10, show_default=True, help="Número de testers (K), além do 'master'.")
+@click.option("--logs", default=50000, show_default=True, help="Linhas de log (L).")
+@click.option("--dias", default=365, show_default=True, help="Período coberto pelos dados, em dias.")
+@click.option("--reprovacao", default=0.15, show_default=True, help="Fração de testes reprovados.")
+@click.option("--aguardando", default=0.1, show_default=True, help="Fração de equipamentos em 'Aguardando Teste'.")
+@click.option("--senha", default="bench", show_default=True, help="Senha de todos os utilizadores gerados.")
+@click.option("--semente", default=42, show_default=True, help="Semente do gerador aleatório (dados reprodutíveis).")
+@click.option("--substituir", is_flag=True, help="Apaga o ficheiro de destino se já existir.")
+def gerar_dados_command(destino, equipamentos, testes, usuarios, logs, dias, reprovacao, aguardando, senha, semente, substituir):
+    """Cria um banco SQLite descartável com dados sintéticos para benchmarks (ver benchmark.py)."""
+    destino = os.path.abspath(destino)
+    destino_uri = f"sqlite:///{destino}"
+    if destino_uri == app.config["SQLALCHEMY_DATABASE_URI"]:
+        print("❌ O destino é o próprio banco configurado; escolha outro ficheiro."); return
+    if os.path.exists(destino):
+        if not substituir:
+            print(f"❌ {destino} já existe; use --substituir para o recriar."); return
+        for sufixo in ("", "-wal", "-shm"):
+            if os.path.exists(destino + sufixo):
+                os.remove(destino + sufixo)
+
+    if equipamentos > 1 << 24:
+        print("❌ No máximo 16777216 equipamentos (sufixos de MAC distintos)."); return
+    aleatorio = random.Random(semente)
+    inicio = get_brasil_datetime().replace(tzinfo=None) - timedelta(days=dias)
+    engine = create_engine(destino_uri)
+    db.metadata.create_all(engine)
+    senha_hash = generate_password_hash(senha)
+    contagens = {}
+
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [{"id": 1, "username": "master", "password_hash": senha_hash, "role": "master"}] + [
+            {"id": i + 2, "username": f"tester{i + 1:02d}", "password_hash": senha_hash, "role": "suporte"}
+            for i in range(usuarios)
+        ])
+        testers = [(i + 2, f"tester{i + 1:02d}") for i in range(usuarios)] or [(1, "master")]
+        nomes = dict(testers)
+        # Sufixos distintos garantem MACs únicos sem verificar colisões
+        sufixos = aleatorio.sample(range(1 << 24), equipamentos)
+
+        def gerar_mac(indice: int) -> str:
+            sufixo = sufixos[indice]
+            return f"{GERADOR_OUIS[indice % len(GERADOR_OUIS)]}:{sufixo >> 16:02X}:{(sufixo >> 8) & 0xFF:02X}:{sufixo & 0xFF:02X}"
+        teste_id = 0
+        for parte in em_partes(list(range(equipamentos)), EXPORT_LOTE):
+            linhas_equip, linhas_teste, linhas_resumo = [], [], []
+            for indice in parte:
+                equip_id = indice + 1
+                serial = gerar_mac(indice)
+                tipo, modelo = aleatorio.choice(GERADOR_MODELOS)
+                cadastro = inicio + timedelta(seconds=aleatorio.randrange(dias * 86400))
+                chave = (cadastro.date(), STATUS_CADASTRO, 0, modelo)
+                contagens[chave] = contagens.get(chave, 0) + 1
+
+                data_teste, ultimo = cadastro, None
+                for _ in range(testes):
+                    teste_id += 1
+                    data_teste += timedelta(minutes=aleatorio.randint(5, 60 * 24 * 7))
+                    status = "Reprovado" if aleatorio.random() < reprovacao else "Aprovado"
+                    user_id, username = aleatorio.choice(testers)
+                    ultimo = {
+                        "id": teste_id,
+                        "data_teste": data_teste,
+                        "status": status,
+                        "velocidade_teste": f"{aleatorio.uniform(80, 950):.1f}",
+                        "sinal_dbm": f"{aleatorio.uniform(-27, -15):.1f}",
+                        "observacoes": aleatorio.choice(GERADOR_OBSERVACOES) if status == "Reprovado" else None,
+                        "equipamento_id": equip_id,
+                        "user_id": user_id,
+                    }
+                    linhas_teste.append(ultimo)
+                    chave = (data_teste.date(), status, user_id, modelo)
+                    contagens[chave] = contagens.get(chave, 0) + 1
+
+                if ultimo is None or aleatorio.random() < aguardando:
+                    status_atual = "Aguardando Teste"
+                else:
+                    status_atual = ultimo["status"]
+                linhas_equip.append({
+                    "id": equip_id, "tipo": tipo, "modelo": modelo, "serial": serial, "mac_inteiro": mac_para_inteiro(serial),
+                    "status_atual": status_atual, "data_cadastro": cadastro,
+                })
+                if ultimo is not None:
+                    linhas_resumo.append({
+                        "equipamento_id": equip_id,
+                        "ultimo_teste_id": ultimo["id"],
+                        "ultimo_teste_data": ultimo["data_teste"],
+                        "ultimo_tester_nome": nomes[ultimo["user_id"]],
+                        "ultima_velocidade": ultimo["velocidade_teste"],
+                        "ultimo_sinal_dbm": ultimo["sinal_dbm"],
+                        "ultimas_observacoes": ultimo["observacoes"],
+                        "total_testes": testes,
+                    })
+            conn.execute(Equipamento.__table__.insert(), linhas_equip)
+            if linhas_teste:
+                conn.execute(Teste.__table__.insert(), linhas_teste)
+            if linhas_resumo:
+                conn.execute(EquipamentoResumo.__table__.insert(), linhas_resumo)
+
+        if contagens:
+            conn.execute(ContagemDiaria.__table__.insert(), [
+                {"dia": dia, "status": status, "user_id": user_id, "modelo": modelo, "total": total}
+                for (dia, status, user_id, modelo), total in contagens.items()
+            ])
+
+        mensagens = (
+            ("INFO", "Utilizador '{u}' realizou login."),
+            ("SUCCESS", "Teste 'Aprovado' registado para equipamento: {s}."),
+            ("SUCCESS", "Novo equipamento registado: {s} (ONU/AN5506-01-A)."),
+            ("WARNING", "Equipamento '{s}' e todo o seu histórico foram apagados."),
+            ("DANGER", "Falha ao salvar teste para: {s}."),
+        )
+        for parte in em_partes(list(range(logs)), EXPORT_LOTE):
+            linhas_log = []
+            for _ in parte:
+                user_id, username = aleatorio.choice(testers)
+                level, mensagem = aleatorio.choices(mensagens, weights=(30, 50, 15, 3, 2))[0]
+                linhas_log.append({
+                    "timestamp": inicio + timedelta(seconds=aleatorio.randrange(dias * 86400)),
+                    "level": level,
+                    "message": mensagem.format(u=username, s=gerar_mac(aleatorio.randrange(equipamentos)) if equipamentos else "-"),
+                    "user_id": user_id,
+                })
+            conn.execute(Log.__table__.insert(), linhas_log)
+    engine.dispose()
+    print(f"✅ {destino}: {equipamentos} equipamento(s), {teste_id} teste(s), {usuarios + 1} utilizador(es), {logs} log(s).")
+    print(f"ℹ️ Benchmark: python benchmark.py --banco {destino} --senha {senha}")
+
+@app.cli.command("check-importacao")
+@click.option("--orcamento-ms", default=1500.0, show_default=True, help="Tempo máximo para importar o app.")
+@click.option("--top", default=10, show_default=True, help="Quantos módulos mais lentos listar.")
+def check_importacao_command(orcamento_ms: float, top: int):
+    """Mede a importação do app (python -X importtime) e falha se passar do orçamento ou carregar o WeasyPrint."""
+    ambiente = dict(os.environ, PDF_AQUECER="0")
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=base_dir, env=ambiente, capture_output=True, text=True,
+    )
+    if resultado.returncode != 0:
+        print(f"❌ Falha ao importar o app:\n{resultado.stderr[-2000:]}"); sys.exit(1)
+    modulos = []
+    for linha in resultado.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not linha.startswith("import time:") or "imported package" in linha:
+            continue
+        _proprio, cumulativo, nome = linha[len("import time:"):].split("|")
+        modulos.append((int(cumulativo) / 1000, nome.rstrip()))
+    total_ms = next((ms for ms, nome in modulos if nome.strip() == "app"), 0.0)
+    # Imports diretos do app (um nível de indentação abaixo dele), dos mais lentos
+    diretos = [(ms, nome.strip()) for ms, nome in modulos if len(nome) - len(nome.lstrip()) == 3]
+    for ms, nome in sorted(diretos, reverse=True)[:top]:
+        print(f"{ms:9.1f} ms  {nome}")
+    problemas = []
+    if any(nome.strip().split(".")[0] == "weasyprint" for _, nome in modulos):
+        problemas.append("o WeasyPrint foi importado no arranque (deve ficar em pdf_render, sob demanda)")
+    if total_ms > orcamento_ms:
+        problemas.append(f"importação levou {total_ms:.0f} ms (orçamento: {orcamento_ms:.0f} ms)")
+    if problemas:
+        for problema in problemas: print(f"❌ {problema}")
+        sys.exit(1)
+    print(f"✅ Importação do app em {total_ms:.0f} ms (orçamento: {orcamento_ms:.0f} ms), sem WeasyPrint.")
+
 @app.cli.command("create-master")
 def create_master_command():
     if User.query.filter_by(username="master").first(): print("ℹ️ Utilizador 'master' já existe."); return
@@ -0,0 +1,160 @@
+"""
+Ficheiros estáticos com nome por hash de conteúdo e compressão gzip/brotli.
+
+`ManifestoAssets` percorre o diretório `static` e associa cada ficheiro a um nome
+com os primeiros caracteres do SHA-256 do conteúdo (ex.: `css/base.3f2a1b9c0d.css`).
+Como o nome muda sempre que o conteúdo muda, as respostas podem ser cacheadas pelo
+navegador para sempre (`Cache-Control: immutable`). `precomprimir` grava ao lado de
+cada ficheiro as versões `.gz` e `.br`, servidas sem custo de CPU por request.
+
+O brotli é opcional: sem o pacote, só é usado gzip.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # pacote opcional (pip install brotli)
+    brotli = None
+
+EXTENSOES_COMPRIMIDAS = {".gz": "gzip", ".br": "br"}
+# Tipos que compensam comprimir; imagens PNG/JPEG já vêm comprimidas
+EXTENSOES_TEXTO = (".css", ".js", ".html", ".json", ".svg", ".txt", ".map")
+
+
+def codificacoes_disponiveis() -> Tuple[str, ...]:
+    """Codificações suportadas por este processo, da preferida para a menos preferida."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def comprimir(dados: bytes, codificacao: str, nivel: Optional[int] = None) -> bytes:
+    """Comprime `dados` em "gzip" (nível 1-9, padrão 6) ou "br" (qualidade 0-11, padrão 5)."""
+    if codificacao == "br":
+        if brotli is None:
+            raise ValueError("brotli não está instalado.")
+        return brotli.compress(dados, quality=5 if nivel is None else nivel)
+    if codificacao == "gzip":
+        # mtime=0: o mesmo conteúdo gera sempre os mesmos bytes (ETag estável)
+        return gzip.compress(dados, compresslevel=6 if nivel is None else nivel, mtime=0)
+    raise ValueError(f"Codificação desconhecida: {codificacao}")
+
+
+def nome_com_hash(caminho: str, resumo: str) -> str:
+    raiz, extensao = os.path.splitext(caminho)
+    return f"{raiz}.{resumo}{extensao}"
+
+
+class ManifestoAssets:
+    """Mapa caminho -> nome com hash dos ficheiros de `diretorio`, lido sob demanda.
+
+    Com `recarregar=True` (modo debug) o diretório é relido a cada consulta, para que
+    alterações no CSS apareçam sem reiniciar o servidor; só os ficheiros com tamanho ou
+    data de modificação diferentes voltam a ser lidos.
+    """
+
+    def __init__(self, diretorio: str, tamanho_hash: int = 10, recarregar: bool = False):
+        self.diretorio = diretorio
+        self.tamanho_hash = tamanho_hash
+        self.recarregar = recarregar
+        self._por_caminho: Optional[Dict[str, str]] = None
+        self._por_nome: Dict[str, str] = {}
+        self._assinaturas: Dict[str, Tuple[float, int, str]] = {}
+        self._comprimidos: Dict[Tuple[str, str], bytes] = {}
+        self._lock = threading.Lock()
+
+    def _arquivos(self) -> Iterable[str]:
+        for raiz, _pastas, arquivos in os.walk(self.diretorio):
+            for arquivo in arquivos:
+                if os.path.splitext(arquivo)[1] in EXTENSOES_COMPRIMIDAS:
+                    continue
+                caminho = os.path.join(raiz, arquivo)
+                yield os.path.relpath(caminho, self.diretorio).replace(os.sep, "/")
+
+    def _carregar(self) -> Dict[str, str]:
+        if self._por_caminho is not None and not self.recarregar:
+            return self._por_caminho
+        with self._lock:
+            if self._por_caminho is None or self.recarregar:
+                por_caminho, assinaturas = {}, {}
+                for caminho in self._arquivos():
+                    info = os.stat(os.path.join(self.diretorio, caminho))
+                    anterior = self._assinaturas.get(caminho)
+                    if anterior and anterior[:2] == (info.st_mtime, info.st_size):
+                        nome = anterior[2]
+                    else:
+                        nome = nome_com_hash(caminho, self._resumo(caminho))
+                        self._comprimidos.pop((caminho, "br"), None)
+                        self._comprimidos.pop((caminho, "gzip"), None)
+                    assinaturas[caminho] = (info.st_mtime, info.st_size, nome)
+                    por_caminho[caminho] = nome
+                self._assinaturas = assinaturas
+                self._por_nome = {nome: caminho for caminho, nome in por_caminho.items()}
+                self._por_caminho = por_caminho
+        return self._por_caminho
+
+    def _resumo(self, caminho: str) -> str:
+        sha = hashlib.sha256()
+        with open(os.path.join(self.diretorio, caminho), "rb") as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(bloco)
+        return sha.hexdigest()[:self.tamanho_hash]
+
+    def nome(self, caminho: str) -> Optional[str]:
+        """Nome com hash de `caminho` (relativo a `diretorio`), ou None se não existir."""
+        return self._carregar().get(caminho)
+
+    def resolver(self, nome: str) -> Optional[str]:
+        """Caminho real de um nome com hash; None se o hash não for o do conteúdo atual."""
+        self._carregar()
+        return self._por_nome.get(nome)
+
+    def comprimido_em_memoria(self, caminho: str, codificacao: str) -> bytes:
+        """Versão comprimida de `caminho` calculada uma vez por processo (sem `precomprimir`)."""
+        chave = (caminho, codificacao)
+        dados = self._comprimidos.get(chave)
+        if dados is None:
+            with open(os.path.join(self.diretorio, caminho), "rb") as f:
+                dados = comprimir(f.read(), codificacao)
+            self._comprimidos[chave] = dados
+        return dados
+
+
+def precomprimir(diretorio: str, minimo: int = 1024) -> Dict[str, int]:
+    """Grava `.gz` (e `.br`, se houver brotli) dos ficheiros de texto de `diretorio`.
+
+    Ignora ficheiros menores que `minimo` bytes e os que já têm uma versão comprimida
+    mais recente que o original. Remove as versões comprimidas cujo original sumiu.
+    """
+    contagem = {"gravados": 0, "atuais": 0, "removidos": 0}
+    for raiz, _pastas, arquivos in os.walk(diretorio):
+        for arquivo in arquivos:
+            caminho = os.path.join(raiz, arquivo)
+            original, extensao = os.path.splitext(caminho)
+            if extensao in EXTENSOES_COMPRIMIDAS:
+                if not os.path.exists(original):
+                    os.remove(caminho)
+                    contagem["removidos"] += 1
+                continue
+            if not arquivo.endswith(EXTENSOES_TEXTO) or os.path.getsize(caminho) < minimo:
+                continue
+            dados = None
+            for sufixo, codificacao in EXTENSOES_COMPRIMIDAS.items():
+                if codificacao not in codificacoes_disponiveis():
+                    continue
+                destino = caminho + sufixo
+                if os.path.exists(destino) and os.path.getmtime(destino) >= os.path.getmtime(caminho):
+                    contagem["atuais"] += 1
+                    continue
+                if dados is None:
+                    with open(caminho, "rb") as f:
+                        dados = f.read()
+                comprimido = comprimir(dados, codificacao, nivel=9 if codificacao == "gzip" else 11)
+                temporario = destino + ".tmp"
+                with open(temporario, "wb") as f:
+                    f.write(comprimido)
+                os.replace(temporario, destino)
+                contagem["gravados"] += 1
+    return contagem
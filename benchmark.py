@@ -0,0 +1,165 @@
+"""
+Benchmark das rotas principais com o cliente de teste do Flask.
+
+Usa um banco descartável gerado por `flask gerar-dados` e mede, por rota, a latência
+(p50/p95), o número de consultas SQL e o pico de memória (tracemalloc). Os resultados
+são gravados em JSON para comparar execuções:
+
+    flask gerar-dados --destino bench.db --equipamentos 20000 --testes 3
+    python benchmark.py --banco bench.db --saida antes.json
+    python benchmark.py --banco bench.db --saida depois.json --comparar antes.json
+"""
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+from sqlalchemy import event
+
+from metricas import percentil
+
+
+def montar_rotas(db, Equipamento, Teste) -> dict:
+    """Rotas a medir, com parâmetros tirados do próprio banco (MAC, dia e equipamento reais)."""
+    equipamento = Equipamento.query.order_by(Equipamento.id).first()
+    if equipamento is None:
+        raise click.ClickException("O banco não tem equipamentos; gere-o com 'flask gerar-dados'.")
+    mais_testado = (
+        db.session.query(Teste.equipamento_id)
+        .group_by(Teste.equipamento_id)
+        .order_by(db.func.count().desc())
+        .limit(1).scalar()
+    ) or equipamento.id
+    ultimo_teste = db.session.query(db.func.max(Teste.data_teste)).scalar()
+    dia = ultimo_teste.strftime("%Y-%m-%d") if ultimo_teste else ""
+    trecho_mac = equipamento.serial[-5:]
+    return {
+        "index": "/",
+        "pesquisar": "/pesquisar",
+        "pesquisar_mac": f"/pesquisar?q={trecho_mac}",
+        "pesquisar_status": "/pesquisar?filtro_status=Reprovado",
+        "pesquisar_dia": f"/pesquisar?filtro_dia={dia}",
+        "historico": f"/historico/{mais_testado}",
+        "historico_pdf": f"/historico/{mais_testado}/export/pdf",
+        "pesquisa_pdf": f"/export/pesquisa/pdf?q={trecho_mac}",
+        "pesquisa_pdf_dia": f"/export/pesquisa/pdf?filtro_dia={dia}",
+        "pesquisa_csv_dia": f"/export/pesquisa.csv?filtro_dia={dia}",
+        "stats": f"/stats?dia={dia}",
+        "admin_logs": "/admin/logs",
+    }
+
+
+@click.command()
+@click.option("--banco", required=True, type=click.Path(exists=True, dir_okay=False), help="Ficheiro SQLite gerado por 'flask gerar-dados'.")
+@click.option("--usuario", default="master", show_default=True)
+@click.option("--senha", default="bench", show_default=True)
+@click.option("--repeticoes", default=20, show_default=True, help="Medições por rota.")
+@click.option("--aquecimento", default=2, show_default=True, help="Pedidos descartados antes de medir.")
+@click.option("--rota", "rotas_escolhidas", multiple=True, help="Mede só estas rotas (pode repetir).")
+@click.option("--saida", default=None, help="Ficheiro JSON de resultados (padrão: benchmark_<data>.json).")
+@click.option("--comparar", default=None, type=click.Path(exists=True, dir_okay=False), help="JSON de uma execução anterior.")
+def benchmark(banco, usuario, senha, repeticoes, aquecimento, rotas_escolhidas, saida, comparar):
+    """Mede as rotas principais sobre o banco sintético e grava os resultados em JSON."""
+    # A configuração do app é lida na importação: o banco e os diretórios têm de vir antes.
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(banco)}"
+    temporario = tempfile.mkdtemp(prefix="benchmark_")
+    os.environ.setdefault("PDF_SPOOL_DIR", os.path.join(temporario, "spool"))
+    os.environ.setdefault("PDF_CACHE_DIR", os.path.join(temporario, "cache"))
+    os.environ.setdefault("PDF_CACHE_MAX_MB", "0")  # mede a renderização, não o cache de PDFs
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app, db, Equipamento, Teste
+
+    app.config["TESTING"] = True
+    contador = {"consultas": 0}
+
+    with app.app_context():
+        def contar(*_args):
+            contador["consultas"] += 1
+        event.listen(db.engine, "before_cursor_execute", contar)
+        rotas = montar_rotas(db, Equipamento, Teste)
+        volumes = {
+            "equipamentos": db.session.query(db.func.count(Equipamento.id)).scalar(),
+            "testes": db.session.query(db.func.count(Teste.id)).scalar(),
+        }
+    if rotas_escolhidas:
+        desconhecidas = set(rotas_escolhidas) - set(rotas)
+        if desconhecidas:
+            raise click.ClickException(f"Rotas desconhecidas: {', '.join(sorted(desconhecidas))}")
+        rotas = {nome: url for nome, url in rotas.items() if nome in rotas_escolhidas}
+
+    cliente = app.test_client()
+    resposta = cliente.post("/login", data={"username": usuario, "password": senha})
+    if resposta.status_code != 302 or "/login" in resposta.headers.get("Location", ""):
+        raise click.ClickException(f"Login de '{usuario}' falhou; confira --usuario/--senha.")
+
+    def pedir(url: str):
+        inicio = time.perf_counter()
+        resposta = cliente.get(url)
+        corpo = resposta.get_data()  # consome também as respostas em streaming
+        resposta.close()
+        return time.perf_counter() - inicio, resposta.status_code, len(corpo)
+
+    resultados = {}
+    for nome, url in rotas.items():
+        for _ in range(aquecimento):
+            pedir(url)
+        tempos, consultas, status = [], [], set()
+        for _ in range(repeticoes):
+            contador["consultas"] = 0
+            duracao, codigo, tamanho = pedir(url)
+            tempos.append(duracao * 1000)
+            consultas.append(contador["consultas"])
+            status.add(codigo)
+        # Memória numa passagem à parte: o tracemalloc atrasaria as medições de tempo
+        tracemalloc.start()
+        pedir(url)
+        _atual, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultados[nome] = {
+            "url": url,
+            "status": sorted(status),
+            "p50_ms": round(percentil(tempos, 50), 2),
+            "p95_ms": round(percentil(tempos, 95), 2),
+            "min_ms": round(min(tempos), 2),
+            "max_ms": round(max(tempos), 2),
+            "consultas": max(consultas),
+            "pico_memoria_kb": round(pico / 1024, 1),
+            "bytes_resposta": tamanho,
+        }
+
+    anteriores = {}
+    if comparar:
+        with open(comparar, encoding="utf-8") as f:
+            anteriores = json.load(f).get("rotas", {})
+
+    print(f"{'rota':<20}{'p50 ms':>10}{'p95 ms':>10}{'SQL':>6}{'pico KB':>10}  status")
+    for nome, r in resultados.items():
+        linha = f"{nome:<20}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['consultas']:>6}{r['pico_memoria_kb']:>10}  {r['status']}"
+        anterior = anteriores.get(nome)
+        if anterior and anterior.get("p50_ms"):
+            variacao = (r["p50_ms"] - anterior["p50_ms"]) / anterior["p50_ms"] * 100
+            linha += f"  (p50 {variacao:+.0f}%, SQL {anterior['consultas']}→{r['consultas']})"
+        print(linha)
+
+    saida = saida or f"benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump({
+            "gerado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "banco": os.path.abspath(banco),
+            "volumes": volumes,
+            "repeticoes": repeticoes,
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "rotas": resultados,
+        }, f, indent=2, ensure_ascii=False)
+    shutil.rmtree(temporario, ignore_errors=True)
+    print(f"✅ Resultados gravados em {saida}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -2,12 +2,11 @@
 echo "Construindo executável do Sistema de Controle de Testes..."
 echo
 
-pyinstaller --name="SistemaControleTestes" \
-    --onefile \
-    --add-data="templates:templates" \
-    --add-data="static:static" \
-    --noconsole \
-    main.py
+# Versões .gz/.br dos estáticos, incluídas no executável junto com a pasta static
+flask --app app comprimir-assets
+
+# Opções (hidden imports, exclusões, dados) ficam todas no .spec
+pyinstaller --noconfirm SistemaControleTestes.spec
 
 echo
 echo "✅ Executável criado com sucesso!"
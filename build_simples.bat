@@ -2,19 +2,10 @@
 echo Construindo Sistema de Controle de Testes...
 echo.
 
-pyinstaller --onefile ^
-    --name="SistemaControleTestes" ^
-    --add-data="templates;templates" ^
-    --add-data="static;static" ^
-    --hidden-import="sqlalchemy.sql.default_comparator" ^
-    --hidden-import="flask_login" ^
-    --hidden-import="flask_sqlalchemy" ^
-    --hidden-import="weasyprint" ^
-    --hidden-import="cairo" ^
-    --hidden-import="cffi" ^
-    --hidden-import="markupsafe" ^
-    --noconsole ^
-    main.py
+REM Versões .gz/.br dos estáticos, incluídas no executável junto com a pasta static
+flask --app app comprimir-assets
+REM Opções (hidden imports, exclusões, dados) ficam todas no .spec
+pyinstaller --noconfirm SistemaControleTestes.spec
 
 echo.
 echo ✅ Executável criado: dist\SistemaControleTestes.exe
@@ -0,0 +1,79 @@
+"""
+Cache de fragmentos HTML já renderizados, indexado pela versão dos dados.
+
+A primeira camada é um CacheLRU em memória (por processo). Opcionalmente, uma segunda
+camada num diretório partilhado permite que os vários workers do gunicorn reaproveitem
+o fragmento renderizado por outro. Ao guardar uma versão nova, as anteriores são
+descartadas das duas camadas: nunca é preciso invalidar entrada a entrada.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from cache_memoria import CacheLRU
+
+
+class CacheFragmentos:
+    """Fragmentos HTML por (versão, chave), em memória e, se houver `diretorio`, em disco."""
+
+    def __init__(self, max_itens: int = 256, diretorio: Optional[str] = None):
+        self.memoria = CacheLRU(max_itens=max_itens)
+        self.diretorio = diretorio or None
+        self._versao = 0
+        self._lock = threading.Lock()
+
+    def _caminho(self, versao: int, chave: str) -> str:
+        resumo = hashlib.sha256(chave.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.diretorio, f"{versao}-{resumo}.html")
+
+    def obter(self, versao: int, chave: str) -> Optional[str]:
+        html = self.memoria.obter((versao, chave))
+        if html is not None or not self.diretorio:
+            return html
+        try:
+            with open(self._caminho(versao, chave), encoding="utf-8") as f:
+                html = f.read()
+        except FileNotFoundError:
+            return None
+        self.memoria.guardar((versao, chave), html)
+        return html
+
+    def guardar(self, versao: int, chave: str, html: str) -> None:
+        with self._lock:
+            nova_versao = versao > self._versao
+            if nova_versao:
+                self._versao = versao
+                self.memoria.limpar()
+        self.memoria.guardar((versao, chave), html)
+        if not self.diretorio:
+            return
+        os.makedirs(self.diretorio, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=self.diretorio, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(html)
+        os.replace(temporario, self._caminho(versao, chave))
+        if nova_versao:
+            self._remover_versoes_antigas(versao)
+
+    def _remover_versoes_antigas(self, versao: Optional[int]) -> None:
+        """Apaga do diretório os fragmentos anteriores a `versao` (todos, se for None)."""
+        for entrada in os.scandir(self.diretorio):
+            prefixo = entrada.name.split("-", 1)[0]
+            try:
+                if entrada.name.endswith(".tmp"):
+                    # Temporários órfãos (worker morto a meio da escrita)
+                    antigo = entrada.stat().st_mtime < time.time() - 3600
+                else:
+                    antigo = prefixo.isdigit() and (versao is None or int(prefixo) < versao)
+                if antigo:
+                    os.remove(entrada.path)
+            except FileNotFoundError:
+                pass  # outro worker já o apagou
+
+    def limpar(self) -> None:
+        self.memoria.limpar()
+        if self.diretorio and os.path.isdir(self.diretorio):
+            self._remover_versoes_antigas(None)
@@ -0,0 +1,51 @@
+"""
+Cache em memória, limitado em número de itens (LRU) e com tempo de vida (TTL).
+
+É local a cada processo; quem o usa decide como invalidar entre workers
+(ex.: um contador de versão partilhado no banco).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class CacheLRU:
+    """Dicionário thread-safe que descarta o item menos usado e os itens expirados."""
+
+    def __init__(self, max_itens: int = 1024, ttl: Optional[float] = None):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave: Hashable, padrao: Any = None) -> Any:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return padrao
+            valor, expira_em = item
+            if expira_em is not None and expira_em < time.monotonic():
+                del self._itens[chave]
+                return padrao
+            self._itens.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave: Hashable, valor: Any) -> None:
+        expira_em = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._itens[chave] = (valor, expira_em)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def remover(self, chave: Hashable) -> None:
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._itens.clear()
+
+    def __len__(self) -> int:
+        return len(self._itens)
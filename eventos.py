@@ -0,0 +1,113 @@
+"""
+Canal de eventos de alteração para os clientes ligados por Server-Sent Events.
+
+Cada cliente SSE tem uma inscrição com uma fila limitada. Os eventos gravados por
+este processo são publicados logo após o commit; os gravados por outros workers do
+gunicorn chegam por uma thread que consulta a tabela de eventos a cada `intervalo`
+segundos (só enquanto houver inscritos). Um cliente lento cuja fila encha é desligado;
+ao reconectar, recupera o que perdeu pelo Last-Event-ID.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+
+class Inscricao:
+    """Fila de eventos de um cliente SSE."""
+
+    def __init__(self, max_fila: int):
+        self.fila: "queue.Queue[dict]" = queue.Queue(maxsize=max_fila)
+        self.ativa = True
+
+
+class CanalEventos:
+    """Pub/sub em memória, completado por polling de `carregar_desde(id)` entre workers."""
+
+    def __init__(
+        self,
+        carregar_desde: Callable[[int], List[dict]],
+        ultimo_id: Callable[[], int],
+        max_fila: int = 100,
+        intervalo: float = 2.0,
+        sobreposicao: int = 50,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.carregar_desde = carregar_desde
+        self.ultimo_id = ultimo_id
+        self.max_fila = max_fila
+        self.intervalo = intervalo
+        # Relê os últimos N ids a cada consulta: transações concorrentes podem fazer commit
+        # fora da ordem dos ids (PostgreSQL); os repetidos são filtrados por `_vistos`.
+        self.sobreposicao = sobreposicao
+        self.logger = logger or logging.getLogger(__name__)
+        self._inscricoes: set = set()
+        self._vistos: deque = deque(maxlen=1000)
+        self._vistos_set: set = set()
+        self._ultimo = 0
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._inscricoes)
+
+    def inscrever(self) -> Inscricao:
+        inscricao = Inscricao(self.max_fila)
+        with self._lock:
+            self._inscricoes.add(inscricao)
+            # Após um fork (workers do gunicorn) a thread do processo pai não existe no filho.
+            if self.intervalo > 0 and (self._thread is None or self._pid != os.getpid()):
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop, name="canal-eventos", daemon=True)
+                self._thread.start()
+        return inscricao
+
+    def cancelar(self, inscricao: Inscricao) -> None:
+        inscricao.ativa = False
+        with self._lock:
+            self._inscricoes.discard(inscricao)
+
+    def publicar(self, eventos: List[dict]) -> None:
+        """Entrega `eventos` (com "id") a todas as inscrições, ignorando os já entregues."""
+        with self._lock:
+            novos = []
+            for evento in eventos:
+                if evento["id"] in self._vistos_set:
+                    continue
+                if len(self._vistos) == self._vistos.maxlen:
+                    self._vistos_set.discard(self._vistos[0])
+                self._vistos.append(evento["id"])
+                self._vistos_set.add(evento["id"])
+                self._ultimo = max(self._ultimo, evento["id"])
+                novos.append(evento)
+            if not novos:
+                return
+            for inscricao in list(self._inscricoes):
+                try:
+                    for evento in novos:
+                        inscricao.fila.put_nowait(evento)
+                except queue.Full:
+                    # Cliente não está a consumir: desliga-o (reconecta com Last-Event-ID)
+                    inscricao.ativa = False
+                    self._inscricoes.discard(inscricao)
+
+    def _loop(self) -> None:
+        try:
+            self._ultimo = max(self._ultimo, self.ultimo_id())
+        except Exception:
+            self.logger.exception("Falha ao ler o último evento; o polling começa do zero.")
+        while True:
+            time.sleep(self.intervalo)
+            with self._lock:
+                if not self._inscricoes:
+                    self._thread = None
+                    return
+                desde = max(0, self._ultimo - self.sobreposicao)
+            try:
+                self.publicar(self.carregar_desde(desde))
+            except Exception:
+                self.logger.exception("Falha ao consultar eventos de outros workers.")
@@ -0,0 +1,29 @@
+"""
+Configuração do gunicorn (lida automaticamente a partir do diretório de trabalho).
+"""
+import os
+
+# /eventos (SSE) mantém cada ligação aberta: workers com threads evitam que poucos
+# clientes ocupem todos os workers síncronos. O app aceita no máximo GUNICORN_THREADS -
+# EVENTOS_THREADS_RESERVADAS ligações SSE por worker (ver EVENTOS_MAX_CLIENTES em app.py).
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+
+
+def on_starting(server):
+    """Prepara o banco (tabelas em falta, migrações) uma vez, no master, antes dos workers."""
+    from app import app, db, preparar_banco
+
+    with app.app_context():
+        preparar_banco()
+        # Os workers são forks do master: não podem herdar as conexões abertas aqui
+        db.engine.dispose()
+
+
+def post_worker_init(worker):
+    """Prepara o WeasyPrint (fontes/CSS) em segundo plano assim que o worker arranca."""
+    import pdf_render
+    from app import app
+
+    if app.config["PDF_AQUECER"]:
+        pdf_render.aquecer_em_segundo_plano()
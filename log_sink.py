@@ -0,0 +1,96 @@
+"""
+Fila de gravação de logs de auditoria em lote.
+
+As entradas são acumuladas numa fila limitada e gravadas por uma thread em
+segundo plano, num único INSERT em lote a cada intervalo. Se a fila encher, a
+entrada é gravada de imediato no thread de quem chamou (nada é descartado), e
+tudo o que estiver pendente é gravado no encerramento do processo.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+from typing import Callable, List, Optional
+
+
+class FilaLogs:
+    """Agrupa entradas de log e grava-as em lote via `gravar_lote(entradas)`."""
+
+    def __init__(
+        self,
+        gravar_lote: Callable[[List[dict]], None],
+        max_itens: int = 10000,
+        intervalo: float = 2.0,
+        tamanho_lote: int = 500,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.gravar_lote = gravar_lote
+        self.intervalo = intervalo
+        self.tamanho_lote = tamanho_lote
+        self.logger = logger or logging.getLogger(__name__)
+        self._fila: "queue.Queue[dict]" = queue.Queue(maxsize=max_itens)
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _garantir_thread(self) -> None:
+        # Após um fork (workers do gunicorn) a thread do processo pai não existe no filho.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name="fila-logs", daemon=True)
+            self._thread.start()
+            atexit.register(self.parar)
+
+    def enfileirar(self, entradas: List[dict]) -> None:
+        """Coloca as entradas na fila; com a fila cheia, grava-as diretamente."""
+        if not entradas:
+            return
+        self._garantir_thread()
+        excedentes = []
+        for entrada in entradas:
+            try:
+                self._fila.put_nowait(entrada)
+            except queue.Full:
+                excedentes.append(entrada)
+        if excedentes:
+            self.logger.warning("Fila de logs cheia; a gravar %d entrada(s) de forma síncrona.", len(excedentes))
+            self._gravar(excedentes)
+
+    def _gravar(self, lote: List[dict]) -> None:
+        try:
+            self.gravar_lote(lote)
+        except Exception:
+            self.logger.exception("Falha ao gravar %d entrada(s) de log.", len(lote))
+
+    def esvaziar(self) -> None:
+        """Grava já tudo o que estiver na fila, em lotes de `tamanho_lote`."""
+        while True:
+            lote = []
+            try:
+                while len(lote) < self.tamanho_lote:
+                    lote.append(self._fila.get_nowait())
+            except queue.Empty:
+                pass
+            if lote:
+                self._gravar(lote)
+            if len(lote) < self.tamanho_lote:
+                return
+
+    def _loop(self) -> None:
+        while not self._parar.wait(self.intervalo):
+            self.esvaziar()
+        self.esvaziar()
+
+    def parar(self, timeout: float = 10.0) -> None:
+        """Para a thread garantindo a gravação do que estiver pendente."""
+        self._parar.set()
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self.esvaziar()
@@ -4,6 +4,7 @@ Sistema de Controle de Testes - Versão Online
 import os
 import sys
 import threading
+import multiprocessing
 from datetime import datetime, date, timezone, timedelta
 
 # Adiciona o diretório atual ao path
@@ -16,7 +17,8 @@ def get_brasil_datetime():
 
 def main():
     """Função principal para produção"""
-    from app import app, db, User, safe_commit
+    from app import app, db, User, safe_commit, preparar_banco
+    import pdf_render
     
     print("=" * 50)
     print("🚀 SISTEMA CONTROLE TESTES - INICIANDO")
@@ -24,13 +26,17 @@ def main():
     
     # Inicializa banco de dados
     with app.app_context():
-        db.create_all()
+        preparar_banco()
         if not User.query.filter_by(username="admin").first():
             admin_user = User(username="admin", role="admin")
             admin_user.set_password("admin")
             db.session.add(admin_user)
             safe_commit()
             print("✅ Usuário admin criado (admin/admin)")
+
+    # Fontes/CSS do WeasyPrint preparados em segundo plano, sem atrasar o arranque
+    if app.config["PDF_AQUECER"]:
+        pdf_render.aquecer_em_segundo_plano()
     
     # Configurações para produção
     port = int(os.environ.get('PORT', 5000))
@@ -49,4 +55,6 @@ def main():
     )
 
 if __name__ == "__main__":
+    # Necessário para o pool de processos da exportação de PDF no executável (PyInstaller)
+    multiprocessing.freeze_support()
     main()
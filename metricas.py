@@ -0,0 +1,78 @@
+"""
+Agregados de desempenho por rota, mantidos em memória.
+
+Cada request instrumentado entrega uma amostra (tempo total, número e tempo de SQL,
+tempo de templates e de WeasyPrint); guardam-se as últimas `janela` amostras de cada
+endpoint para calcular médias e percentis, e os últimos `max_lentos` requests acima do
+limite para o slow log. Os dados são locais a cada processo.
+"""
+import math
+import threading
+from collections import deque
+from typing import Dict, List
+
+CAMPOS = ("total_ms", "sql_n", "sql_ms", "tpl_ms", "pdf_ms")
+
+
+def percentil(valores: list, p: float) -> float:
+    """Percentil pelo método nearest-rank (sem dependências externas)."""
+    ordenados = sorted(valores)
+    # Menor valor com pelo menos p% das amostras até ele: posição ceil(p/100 * n), a partir de 1
+    indice = max(0, min(len(ordenados) - 1, math.ceil(p * len(ordenados) / 100) - 1))
+    return ordenados[indice]
+
+
+class MetricasRequests:
+    """Janela deslizante de amostras por endpoint e registo dos requests lentos."""
+
+    def __init__(self, janela: int = 500, max_lentos: int = 50):
+        self.janela = janela
+        self._amostras: Dict[str, deque] = {}
+        self._totais: Dict[str, int] = {}
+        self._lentos: deque = deque(maxlen=max_lentos)
+        self._lock = threading.Lock()
+
+    def registar(self, endpoint: str, amostra: dict) -> None:
+        with self._lock:
+            if endpoint not in self._amostras:
+                self._amostras[endpoint] = deque(maxlen=self.janela)
+            self._amostras[endpoint].append(tuple(amostra[c] for c in CAMPOS))
+            self._totais[endpoint] = self._totais.get(endpoint, 0) + 1
+
+    def registar_lento(self, entrada: dict) -> None:
+        with self._lock:
+            self._lentos.appendleft(entrada)
+
+    def resumo(self) -> List[dict]:
+        """Agregados de cada endpoint, do maior p95 para o menor."""
+        with self._lock:
+            copia = {endpoint: list(amostras) for endpoint, amostras in self._amostras.items()}
+            totais = dict(self._totais)
+        linhas = []
+        for endpoint, amostras in copia.items():
+            colunas = dict(zip(CAMPOS, zip(*amostras)))
+            n = len(amostras)
+            linhas.append({
+                "endpoint": endpoint,
+                "requests": totais[endpoint],
+                "amostras": n,
+                "p50_ms": percentil(colunas["total_ms"], 50),
+                "p95_ms": percentil(colunas["total_ms"], 95),
+                "max_ms": max(colunas["total_ms"]),
+                "sql_n": sum(colunas["sql_n"]) / n,
+                "sql_ms": sum(colunas["sql_ms"]) / n,
+                "tpl_ms": sum(colunas["tpl_ms"]) / n,
+                "pdf_ms": sum(colunas["pdf_ms"]) / n,
+            })
+        linhas.sort(key=lambda linha: linha["p95_ms"], reverse=True)
+        return linhas
+
+    def lentos(self) -> List[dict]:
+        with self._lock:
+            return list(self._lentos)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._amostras.clear()
+            self._totais.clear()
+            self._lentos.clear()
@@ -0,0 +1,89 @@
+"""
+Cache em disco de PDFs gerados, endereçado pelo conteúdo de entrada.
+
+A chave resume o template, os parâmetros do relatório e a versão dos dados usados;
+o mesmo relatório sobre os mesmos dados reaproveita o ficheiro já gerado. O cache
+tem um tamanho máximo e descarta primeiro os ficheiros usados há mais tempo (LRU
+pelo mtime, atualizado a cada acerto), o que funciona entre vários workers.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+
+def gerar_chave(*partes) -> str:
+    """Gera a chave (hash SHA-256) a partir das partes que identificam o relatório."""
+    bruto = json.dumps(partes, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+class CachePdf:
+    """Cache LRU de PDFs num diretório, limitado a `max_bytes`."""
+
+    def __init__(self, diretorio: str, max_bytes: int):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+
+    def _caminho(self, chave: str) -> str:
+        return os.path.join(self.diretorio, f"{chave}.pdf")
+
+    def obter(self, chave: str) -> Optional[str]:
+        """Devolve o caminho do PDF em cache (marcando-o como usado) ou None."""
+        caminho = self._caminho(chave)
+        try:
+            os.utime(caminho)
+        except FileNotFoundError:
+            return None
+        return caminho
+
+    def guardar(self, chave: str, conteudo: bytes) -> None:
+        """Guarda `conteudo` sob `chave` de forma atómica e aplica o limite de tamanho."""
+        os.makedirs(self.diretorio, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=self.diretorio, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(conteudo)
+        os.replace(temporario, self._caminho(chave))
+        self.aplicar_limite()
+
+    def guardar_arquivo(self, chave: str, origem: str) -> None:
+        """Copia para o cache um PDF já gerado noutro local (ex.: spool da fila)."""
+        os.makedirs(self.diretorio, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=self.diretorio, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(origem, temporario)
+        os.replace(temporario, self._caminho(chave))
+        self.aplicar_limite()
+
+    def aplicar_limite(self) -> None:
+        """Apaga os PDFs menos usados até o total caber em `max_bytes`."""
+        entradas = []
+        total = 0
+        for entrada in os.scandir(self.diretorio):
+            try:
+                st = entrada.stat()
+            except FileNotFoundError:
+                continue
+            if entrada.name.endswith(".tmp"):
+                # Temporários órfãos (worker morto a meio da escrita)
+                if st.st_mtime < time.time() - 3600:
+                    _remover(entrada.path)
+                continue
+            entradas.append((st.st_mtime, st.st_size, entrada.path))
+            total += st.st_size
+        entradas.sort()
+        for _mtime, tamanho, caminho in entradas:
+            if total <= self.max_bytes:
+                break
+            _remover(caminho)
+            total -= tamanho
+
+
+def _remover(caminho: str) -> None:
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass  # outro worker já o apagou
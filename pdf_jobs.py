@@ -0,0 +1,150 @@
+"""
+Fila de exportação de PDFs em segundo plano.
+
+A renderização com WeasyPrint corre num pool de processos limitado, separado dos
+workers web. O estado de cada job vive apenas em ficheiros no diretório de spool,
+por isso qualquer worker do gunicorn consegue consultar ou servir um job submetido
+por outro.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Optional
+
+import pdf_render
+
+
+class FilaCheiaError(Exception):
+    """Lançada quando já existem demasiados PDFs pendentes neste processo."""
+
+
+def _renderizar_pdf(html: str, destino: str) -> None:
+    """Executado no processo do pool: gera o PDF e publica-o de forma atómica."""
+    try:
+        temporario = destino + ".tmp"
+        pdf_render.renderizar(html, temporario)
+        os.replace(temporario, destino)
+    except Exception as e:
+        with open(destino[:-len(".pdf")] + ".erro", "w", encoding="utf-8") as f:
+            f.write(str(e))
+
+
+class FilaPdf:
+    """Submete, acompanha e limpa jobs de exportação de PDF."""
+
+    def __init__(self, spool_dir: str, max_workers: int = 2, max_pendentes: int = 8, ttl: int = 3600):
+        self.spool_dir = spool_dir
+        self.max_workers = max_workers
+        self.max_pendentes = max_pendentes
+        self.ttl = ttl
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pendentes = 0
+        self._lock = threading.Lock()
+
+    def _caminho(self, job_id: str, extensao: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.{extensao}")
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Criado sob demanda, para que cada worker do gunicorn (pós-fork) tenha o seu pool.
+        # Cada processo do pool prepara o WeasyPrint ao arrancar, não no primeiro job.
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=pdf_render.aquecer)
+        return self._executor
+
+    def _descartar_executor(self, executor: ProcessPoolExecutor) -> None:
+        """Esquece um pool quebrado; o próximo job cria outro."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submeter_no_pool(self, html: str, destino: str):
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(_renderizar_pdf, html, destino)
+        except BrokenProcessPool:
+            # Um processo do pool morreu (ex.: OOM) depois do último job: tenta num pool novo
+            self._descartar_executor(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(_renderizar_pdf, html, destino)
+
+    def _job_terminado(self, job_id: str, executor: ProcessPoolExecutor, future) -> None:
+        with self._lock:
+            self._pendentes -= 1
+        # _renderizar_pdf trata os próprios erros: uma exceção aqui significa que o job nem
+        # chegou ao fim (processo do pool morto), e sem o .erro ficaria "processando" para sempre.
+        erro = BrokenProcessPool("Job cancelado.") if future.cancelled() else future.exception()
+        if erro is None:
+            return
+        with open(self._caminho(job_id, "erro"), "w", encoding="utf-8") as f:
+            f.write(f"O processo de renderização terminou inesperadamente: {erro}")
+        if isinstance(erro, BrokenProcessPool):
+            self._descartar_executor(executor)
+
+    def submeter(self, html: str, nome_arquivo: str, user_id: Optional[int], chave_cache: Optional[str] = None) -> str:
+        """Agenda a renderização de `html` e devolve o id do job.
+
+        `chave_cache` fica nos metadados para que o PDF concluído possa ir para o cache.
+        """
+        self.limpar_expirados()
+        with self._lock:
+            if self._pendentes >= self.max_pendentes:
+                raise FilaCheiaError("Demasiadas exportações em andamento.")
+            self._pendentes += 1
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            job_id = uuid.uuid4().hex
+            with open(self._caminho(job_id, "json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "nome_arquivo": nome_arquivo,
+                    "user_id": user_id,
+                    "chave_cache": chave_cache,
+                    "criado_em": time.time(),
+                }, f)
+            executor, future = self._submeter_no_pool(html, self._caminho(job_id, "pdf"))
+        except Exception:
+            with self._lock:
+                self._pendentes -= 1
+            raise
+        future.add_done_callback(partial(self._job_terminado, job_id, executor))
+        return job_id
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """Devolve os metadados do job com o seu estado, ou None se não existir/expirou."""
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._caminho(job_id, "json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if os.path.exists(self._caminho(job_id, "pdf")):
+            meta["status"] = "concluido"
+        elif os.path.exists(self._caminho(job_id, "erro")):
+            meta["status"] = "erro"
+        else:
+            meta["status"] = "processando"
+        return meta
+
+    def caminho_pdf(self, job_id: str) -> str:
+        return self._caminho(job_id, "pdf")
+
+    def limpar_expirados(self) -> int:
+        """Apaga do spool os ficheiros mais antigos que o TTL; devolve quantos foram apagados."""
+        if not os.path.isdir(self.spool_dir):
+            return 0
+        limite = time.time() - self.ttl
+        apagados = 0
+        for entrada in os.scandir(self.spool_dir):
+            try:
+                if entrada.is_file() and entrada.stat().st_mtime < limite:
+                    os.remove(entrada.path)
+                    apagados += 1
+            except FileNotFoundError:
+                pass  # outro worker já o apagou
+        return apagados
@@ -0,0 +1,75 @@
+"""
+Renderização de PDFs com WeasyPrint, carregado sob demanda.
+
+Importar o WeasyPrint puxa cairo, pango e fontconfig, o que pesa no arranque de cada
+worker; por isso só acontece na primeira exportação ou em `aquecer()`, chamado depois
+do boot (main.py, gunicorn.conf.py e processos da fila de PDFs). A configuração de
+fontes e o CSS base são preparados uma única vez por processo e reaproveitados em
+todas as renderizações.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+# Acima disto a importação do WeasyPrint gera um aviso no log (ver também `flask check-importacao`)
+ORCAMENTO_IMPORTACAO_MS = float(os.environ.get("PDF_ORCAMENTO_IMPORTACAO_MS", 3000))
+CSS_BASE = "@page { size: A4; margin: 1.5cm; }"
+
+logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_estado: Optional[dict] = None
+
+
+def preparar() -> dict:
+    """Importa o WeasyPrint e prepara fontes e CSS base (uma vez por processo)."""
+    global _estado
+    if _estado is not None:
+        return _estado
+    with _lock:
+        if _estado is None:
+            inicio = time.perf_counter()
+            from weasyprint import CSS, HTML
+            from weasyprint.text.fonts import FontConfiguration
+            importacao_ms = (time.perf_counter() - inicio) * 1000
+            font_config = FontConfiguration()
+            _estado = {
+                "HTML": HTML,
+                "font_config": font_config,
+                "stylesheets": [CSS(string=CSS_BASE, font_config=font_config)],
+                "importacao_ms": importacao_ms,
+                "preparacao_ms": (time.perf_counter() - inicio) * 1000,
+            }
+            if importacao_ms > ORCAMENTO_IMPORTACAO_MS:
+                logger.warning(
+                    "Importação do WeasyPrint levou %.0f ms (orçamento: %.0f ms).",
+                    importacao_ms, ORCAMENTO_IMPORTACAO_MS,
+                )
+    return _estado
+
+
+def carregado() -> bool:
+    return _estado is not None
+
+
+def renderizar(html: str, destino: Optional[str] = None) -> Optional[bytes]:
+    """Gera o PDF de `html`; devolve os bytes, ou grava em `destino` se for indicado."""
+    estado = preparar()
+    return estado["HTML"](string=html).write_pdf(
+        destino, stylesheets=estado["stylesheets"], font_config=estado["font_config"]
+    )
+
+
+def aquecer() -> None:
+    """Como `preparar()`, mas sem propagar erros (WeasyPrint ausente não impede o boot)."""
+    try:
+        preparar()
+    except Exception:
+        logger.exception("Falha ao preparar o WeasyPrint; será tentado de novo na primeira exportação.")
+
+
+def aquecer_em_segundo_plano() -> None:
+    """Prepara o WeasyPrint numa thread, sem atrasar o arranque do processo."""
+    if not carregado():
+        threading.Thread(target=aquecer, name="aquecer-pdf", daemon=True).start()
@@ -0,0 +1,14 @@
+from metricas import percentil
+
+
+def test_percentil_nearest_rank():
+    assert percentil(list(range(1, 21)), 95) == 19
+    assert percentil(list(range(1, 101)), 95) == 95
+    assert percentil(list(range(1, 11)), 50) == 5
+    assert percentil(list(range(1, 101)), 7) == 7
+
+
+def test_percentil_extremos():
+    assert percentil([3, 1, 2], 0) == 1
+    assert percentil([3, 1, 2], 100) == 3
+    assert percentil([42], 95) == 42